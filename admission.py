@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+import numpy as np
+
+WINDOW_SECONDS = 60.0  # turn latencies older than this no longer count
+ADJUST_INTERVAL = 10.0  # at most one limit change per interval
+MIN_SAMPLES = 5
+DECREASE_FACTOR = 0.7
+RECOVERY_MARGIN = 0.8  # grow again only once p95 is comfortably under the SLO
+
+
+class AdaptiveLimiter:
+    """
+    Admission control for new calls, replacing a fixed semaphore. The limit follows AIMD on
+    the p95 turn latency of the last WINDOW_SECONDS: above `latency_slo` (or with more model
+    jobs queued than `max_queue_depth`) it is cut by DECREASE_FACTOR and new calls are
+    shed; under RECOVERY_MARGIN x SLO, while the limit is actually in use, it grows by one
+    call per ADJUST_INTERVAL. Calls already admitted are never affected: a lower limit only
+    means nobody new gets in until enough of them finish.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: Optional[int] = None,
+                 latency_slo: float = 3.0, queue_depth: Optional[Callable[[], int]] = None,
+                 max_queue_depth: Optional[int] = None, adaptive: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or initial)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.latency_slo = latency_slo
+        self.queue_depth = queue_depth or (lambda: 0)
+        self.max_queue_depth = max_queue_depth
+        self.adaptive = adaptive
+        self.clock = clock
+        self.in_flight = 0
+        self.shedding = False
+        self.shed_count = 0
+        self.p95: Optional[float] = None
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=500)
+        self._last_adjust = self.clock()
+        self._changed = asyncio.Event()
+
+    @property
+    def headroom(self) -> int:
+        """How many more calls would be admitted right now."""
+        self._adjust()
+        return 0 if self.shedding else max(0, math.floor(self.limit) - self.in_flight)
+
+    def observe(self, latency: float):
+        """A turn's latency in seconds: end of caller speech to first reply audio."""
+        self._latencies.append((self.clock(), latency))
+        self._adjust()
+
+    def _adjust(self):
+        if not self.adaptive:
+            return
+        now = self.clock()
+        while self._latencies and self._latencies[0][0] < now - WINDOW_SECONDS:
+            self._latencies.popleft()
+        self.p95 = float(np.percentile([latency for _, latency in self._latencies], 95)) if self._latencies else None
+        depth = self.queue_depth()
+        queue_full = self.max_queue_depth is not None and depth > self.max_queue_depth
+        measured = self.p95 is not None and len(self._latencies) >= MIN_SAMPLES
+        breached = queue_full or (measured and self.p95 > self.latency_slo)
+        recovered = not queue_full and (self.p95 is None or self.p95 < self.latency_slo * RECOVERY_MARGIN)
+        p95 = "n/a" if self.p95 is None else f"{self.p95:.2f}s"
+
+        if breached and not self.shedding:
+            logging.warning(f"Turn latency p95 {p95} (SLO {self.latency_slo}s), model queue {depth}: "
+                            "not starting new calls")
+        elif self.shedding and recovered:
+            logging.info("Turn latency back under SLO, admitting new calls")
+        self.shedding = breached or (self.shedding and not recovered)
+
+        if now - self._last_adjust < ADJUST_INTERVAL:
+            return
+        previous = self.limit
+        if breached:
+            self.limit = max(float(self.minimum), self.limit * DECREASE_FACTOR)
+        elif recovered and measured and self.in_flight >= math.floor(self.limit):
+            self.limit = min(self.maximum, self.limit + 1)
+        if self.limit != previous:
+            self._last_adjust = now
+            logging.info(f"Concurrency limit {previous:.1f} -> {self.limit:.1f} "
+                         f"(p95 {p95}, in flight {self.in_flight}, model queue {depth})")
+            self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self) -> bool:
+        """Wait for a free slot; False (without waiting) if new calls are being shed."""
+        while True:
+            self._adjust()
+            if self.shedding:
+                self.shed_count += 1
+                return False
+            if self.in_flight < math.floor(self.limit):
+                self.in_flight += 1
+                return True
+            await self._changed.wait()
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[bool]:
+        """`async with limiter.slot() as admitted:`; the slot is held for the whole block."""
+        admitted = await self.acquire()
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+    def metrics(self) -> Dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "shedding": self.shedding,
+            "shed": self.shed_count,
+            "turn_latency_p95": None if self.p95 is None else round(self.p95, 3),
+            "model_queue": self.queue_depth(),
+        }
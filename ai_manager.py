@@ -1,59 +1,115 @@
+import asyncio
 import logging
+import re
+from dataclasses import asdict
 from datetime import datetime
-from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
 from langchain.prompts import PromptTemplate
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList, pipeline
 from TTS.api import TTS
 from vosk import Model as VoskModel, KaldiRecognizer
 import torch
 import json
-import os
-import wave
+from cancellation import CancellationRegistry, CancelToken, Cancelled
+from codec import float_to_pcm16, pcm16_to_wav, wav_to_pcm16
 from config import Config
+from knowledge_base import KnowledgeBase
 from models import Contact, ConversationState
+from opener_cache import Opener, OpenerCache
+from prompt_store import PromptStore
+from remote_llm import RemoteGenerator
+from replies import SpokenBudget, find_stop, parse_budgets, trim_reply
+from speculative import SpeculativeDecoder
+
+TTS_SAMPLE_RATE = 22050
+STT_CHUNK_BYTES = 8000
+FALLBACK_RESPONSE = "I apologize, I'm having technical difficulties. Let me transfer you to a human representative."
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class CancelledCriteria(StoppingCriteria):
+    """Ends generation at the next token once the call's job is cancelled."""
+
+    def __init__(self, token: CancelToken):
+        self.token = token
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.token.cancelled, dtype=torch.bool, device=input_ids.device)
+
+
+class StopOnRoleMarker(StoppingCriteria):
+    """Ends generation once the continuation starts another speaker's line (see replies.ROLE_MARKER)."""
+
+    def __init__(self, tokenizer, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        texts = self.tokenizer.batch_decode(input_ids[:, self.prompt_length:], skip_special_tokens=True)
+        return torch.tensor([find_stop(text) is not None for text in texts], dtype=torch.bool, device=input_ids.device)
+
 
 class AIConversationManager:
     def __init__(self, config: Config):
         self.config = config
-        # Mistral LLM setup
-        self.tokenizer = AutoTokenizer.from_pretrained("mistralai/Mistral-7B-Instruct-v0.2")
-        self.model = AutoModelForCausalLM.from_pretrained("mistralai/Mistral-7B-Instruct-v0.2")
-        self.generator = pipeline(
-            "text-generation",
-            model=self.model,
-            tokenizer=self.tokenizer,
-            device=0 if torch.cuda.is_available() else -1
-        )
+        # Mistral LLM setup. With the remote backend only the tokenizer is loaded here (for
+        # reply budgets); generation runs on the shared inference servers.
+        self.tokenizer = AutoTokenizer.from_pretrained(self.config.llm_model)
+        self.model = self.generator = self.remote = None
+        if self.config.llm_backend == "remote":
+            self.remote = RemoteGenerator(
+                [endpoint.strip() for endpoint in self.config.llm_endpoints.split(",") if endpoint.strip()],
+                self.config.llm_model, self.config.llm_connect_timeout, self.config.llm_read_timeout,
+                self.config.llm_max_connections,
+            )
+        else:
+            self.model = AutoModelForCausalLM.from_pretrained(self.config.llm_model)
+            self.generator = pipeline(
+                "text-generation",
+                model=self.model,
+                tokenizer=self.tokenizer,
+                device=0 if torch.cuda.is_available() else -1
+            )
+        self.speculative = None
+        if self.config.draft_model and self.model is not None:
+            try:
+                self.speculative = SpeculativeDecoder(
+                    self.model, self.tokenizer, self.config.draft_model,
+                    self.config.assisted_prompts, self.config.draft_tokens
+                )
+            except Exception as e:
+                logging.error(f"Speculative decoding disabled: {e}")
         # Coqui TTS setup
         self.tts = TTS(model_name="tts_models/en/ljspeech/tacotron2-DDC", progress_bar=False)
         # Vosk STT setup (ensure model is downloaded and path is correct)
         self.vosk_model = VoskModel("models/vosk-model-small-en-us-0.15")
-        self.prompts = self.load_prompts()
+        self.prompt_store = PromptStore(self.config.prompts_dir, PromptTemplate.from_template)
+        self.openers = OpenerCache(capacity=max(1, 2 * self.config.pregenerate_contacts))
+        self.prompt_store.add_listener(self.openers.invalidate)
+        self.load_prompts()
         self.active_conversations: Dict[str, ConversationState] = {}
+        self.cancellation = CancellationRegistry()
+        self.spoken_budget = SpokenBudget(self.config.reply_budget_seconds, parse_budgets(self.config.reply_budgets))
+        self.knowledge = KnowledgeBase(self.config.knowledge_dir, self.config.knowledge_top_k,
+                                       self.config.knowledge_min_score, self.config.prompt_reload_interval or float("inf"))
         logging.info("AIConversationManager initialized.")
 
     def load_prompts(self) -> Dict[str, PromptTemplate]:
-        prompts = {}
-        prompts_dir = Path(self.config.prompts_dir)
-        prompts_dir.mkdir(exist_ok=True)
-        logging.info(f"Loading prompts from {prompts_dir.resolve()}")
-        for prompt_file in prompts_dir.glob("*.txt"):
-            prompt_name = prompt_file.stem
-            try:
-                content = prompt_file.read_text().strip()
-                if content:
-                    prompts[prompt_name] = PromptTemplate.from_template(content)
-                    logging.info(f"Loaded prompt: {prompt_name}")
-                else:
-                    logging.warning(f"Prompt file {prompt_file} is empty.")
-            except Exception as e:
-                logging.error(f"Error loading prompt {prompt_name}: {e}")
-        logging.info(f"Total prompts loaded: {len(prompts)}")
-        return prompts
+        logging.info(f"Loading prompts from {self.prompt_store.prompts_dir.resolve()}")
+        self.prompt_store.refresh()
+        logging.info(f"Total prompts loaded: {len(self.prompts)}")
+        return self.prompts
+
+    @property
+    def prompts(self) -> Dict[str, PromptTemplate]:
+        return self.prompt_store.templates
+
+    def get_prompt_name(self, contact: Contact) -> str:
+        return contact.prompt_name if contact.prompt_name in self.prompts else "default"
 
     def get_system_prompt(self, contact: Contact) -> PromptTemplate:
-        prompt_name = contact.prompt_name if contact.prompt_name in self.prompts else "default"
+        prompt_name = self.get_prompt_name(contact)
         prompt_template = self.prompts.get(prompt_name, self.prompts.get("default"))
         if not prompt_template:
             logging.warning(f"No prompt found for {contact.prompt_name}, using fallback")
@@ -64,14 +120,14 @@ class AIConversationManager:
         return prompt_template
 
     def reload_prompts(self):
-        self.prompts = self.load_prompts()
+        self.load_prompts()
         logging.info(f"Reloaded {len(self.prompts)} prompts: {list(self.prompts.keys())}")
 
     def get_available_prompts(self) -> List[str]:
         return list(self.prompts.keys())
 
     async def start_conversation(self, contact: Contact, call_id: str) -> ConversationState:
-        logging.info(f"Starting conversation for call_id={call_id}, contact={contact.phone_number}")
+        logging.info("Starting conversation for call_id=%s, contact=%s", call_id, contact.phone_number, extra={"call_id": call_id})
         conversation = ConversationState(
             contact=contact,
             call_id=call_id,
@@ -81,18 +137,53 @@ class AIConversationManager:
         )
         self.active_conversations[call_id] = conversation
         prompt_template = self.get_system_prompt(contact)
-        initial_message = await self.generate_response(prompt_template, "", conversation)
+        conversation.prompt_template = prompt_template
+        conversation.prompt_name = self.get_prompt_name(contact)
+        opener = self.openers.pop(self.openers.key(conversation.prompt_name, contact), self._prompt_version(conversation.prompt_name))
+        if opener:
+            initial_message = opener.text
+            conversation.opening_audio = (opener.audio, opener.sample_rate)
+        else:
+            initial_message = await self.generate_response(prompt_template, "", conversation)
         conversation.conversation_history.append({
             "role": "assistant",
             "content": initial_message,
             "timestamp": datetime.now().isoformat()
         })
-        logging.debug(f"Initial message for {call_id}: {initial_message}")
+        logging.debug("Initial message for %s: %s", call_id, initial_message, extra={"call_id": call_id, "event": "turn"})
         return conversation
 
+    def _prompt_version(self, prompt_name: str) -> Optional[int]:
+        version = self.prompt_store.versions.get(prompt_name)
+        return version.version if version else None
+
+    async def pregenerate_openers(self, contacts: List[Contact]):
+        """
+        Render and synthesize opening lines for contacts about to be dialed, one at a time so
+        it only uses otherwise idle capacity. start_conversation picks them up from the cache.
+        """
+        for contact in contacts:
+            prompt_name = self.get_prompt_name(contact)
+            key = self.openers.key(prompt_name, contact)
+            if key in self.openers:
+                continue
+            version = self._prompt_version(prompt_name)
+            conversation = ConversationState(contact=contact, call_id=f"pregenerate_{contact.phone_number}")
+            try:
+                text = await self.generate_response(self.get_system_prompt(contact), "", conversation)
+                if not text or text == FALLBACK_RESPONSE:
+                    continue
+                pcm, sample_rate = await self.synthesize(text, conversation.call_id)
+            except Cancelled:
+                return
+            if pcm.size and version == self._prompt_version(prompt_name):
+                self.openers.put(key, Opener(text, pcm, sample_rate, version))
+                logging.debug("Pre-generated opener for %s (prompt %s)", contact.phone_number, prompt_name)
+
     async def generate_response(self, system_prompt: PromptTemplate, user_input: str, conversation: ConversationState) -> str:
         try:
-            logging.debug(f"Generating response for call_id={conversation.call_id}, user_input='{user_input}'")
+            logging.debug("Generating response for call_id=%s, user_input=%r", conversation.call_id, user_input,
+                          extra={"call_id": conversation.call_id, "event": "turn"})
             conversation_context = "\n".join([
                 f"{msg['role']}: {msg['content']}" 
                 for msg in conversation.conversation_history[-5:]
@@ -107,93 +198,175 @@ class AIConversationManager:
                 "user_input": user_input
             }
             base_prompt = system_prompt.format(**prompt_vars)
+            prompt_name = conversation.prompt_name or self.get_prompt_name(conversation.contact)
+            # Only the snippets relevant to this turn, instead of every fact in the template.
+            snippets = self.knowledge.search(prompt_name, user_input) if user_input else []
+            knowledge = "".join(f"- {snippet.text}\n" for snippet in snippets)
+            if knowledge:
+                base_prompt += f"\n\nRELEVANT INFORMATION:\n{knowledge}"
             full_prompt = (
                 f"{base_prompt}\n\nCONVERSATION HISTORY:\n{conversation_context}\n\nUSER INPUT: {user_input}\n\n"
-                "Generate a natural, conversational response. Keep it under 30 seconds when spoken."
+                "Generate a natural, conversational response. "
+                f"Keep it under {self.spoken_budget.seconds(prompt_name):g} seconds when spoken.\nassistant:"
             )
-            result = self.generator(full_prompt, max_new_tokens=200, do_sample=True, temperature=0.7)
-            return result[0]['generated_text'].strip()
+            if self.remote:
+                with self.cancellation.job(conversation.call_id) as token:
+                    text = await self.remote.generate(full_prompt, self.spoken_budget.max_new_tokens(prompt_name), token)
+            else:
+                text = (await self._run_job(conversation.call_id, self._generate, full_prompt, prompt_name))[0]['generated_text']
+            return trim_reply(text)
+        except Cancelled:
+            logging.info("Generation cancelled for call_id=%s", conversation.call_id, extra={"call_id": conversation.call_id})
+            raise
         except Exception as e:
-            logging.error(f"Error generating response: {e}")
-            return "I apologize, I'm having technical difficulties. Let me transfer you to a human representative."
+            logging.error("Error generating response: %s", e, extra={"call_id": conversation.call_id})
+            return FALLBACK_RESPONSE
+
+    def _generate(self, prompt: str, prompt_name: str, token: CancelToken) -> list:
+        # Only the continuation comes back, and it ends at the first role marker, at
+        # end-of-sequence, or when it would take longer than the prompt's budget to say.
+        prompt_length = len(self.tokenizer(prompt).input_ids)
+        generate_kwargs = dict(
+            max_new_tokens=self.spoken_budget.max_new_tokens(prompt_name),
+            do_sample=True, temperature=0.7, return_full_text=False,
+            stopping_criteria=StoppingCriteriaList([
+                CancelledCriteria(token), StopOnRoleMarker(self.tokenizer, prompt_length)
+            ]),
+        )
+        if self.speculative:
+            return self.speculative.generate(self.generator, prompt, prompt_name, **generate_kwargs)
+        return self.generator(prompt, **generate_kwargs)
+
+    async def _run_job(self, call_id: str, job: Callable, *args):
+        """
+        Run a blocking model call in the executor under a cancel token for `call_id`. The job
+        raises Cancelled (or stops early and the result is discarded) once the token is set:
+        by cancel(call_id), or because the awaiting task itself was cancelled.
+        """
+        with self.cancellation.job(call_id) as token:
+            def run():
+                token.raise_if_cancelled()  # still queued when the call went away
+                return job(*args, token)
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(None, run)
+            except asyncio.CancelledError:
+                token.cancel()
+                raise
+            token.raise_if_cancelled()
+            return result
+
+    def cancel(self, call_id: str):
+        """Abort every queued or running LLM/TTS/STT job of `call_id`."""
+        cancelled = self.cancellation.cancel(call_id)
+        if cancelled:
+            logging.info("Cancelled %d model job(s) for call_id=%s", cancelled, call_id, extra={"call_id": call_id})
 
     async def process_user_input(self, call_id: str, user_input: str) -> Optional[str]:
-        logging.info(f"Processing user input for call_id={call_id}: {user_input}")
+        logging.info("Processing user input for call_id=%s: %s", call_id, user_input, extra={"call_id": call_id, "event": "turn"})
         conversation = self.active_conversations.get(call_id)
         if not conversation or not conversation.is_active:
-            logging.warning(f"No active conversation for call_id={call_id}")
+            logging.warning("No active conversation for call_id=%s", call_id, extra={"call_id": call_id})
             return None
         opt_out_keywords = ['stop', 'remove', 'unsubscribe', 'do not call', 'take me off']
         if any(keyword in user_input.lower() for keyword in opt_out_keywords):
             conversation.opt_out_requested = True
             conversation.is_active = False
-            logging.info(f"Opt-out requested for call_id={call_id}")
+            logging.info("Opt-out requested for call_id=%s", call_id, extra={"call_id": call_id})
             return "I understand. I'll remove you from our list immediately. Thank you for your time. Have a great day!"
         conversation.conversation_history.append({
             "role": "user",
             "content": user_input,
             "timestamp": datetime.now().isoformat()
         })
-        system_prompt = self.get_system_prompt(conversation.contact)
+        system_prompt = conversation.prompt_template or self.get_system_prompt(conversation.contact)
         response = await self.generate_response(system_prompt, user_input, conversation)
         conversation.conversation_history.append({
             "role": "assistant",
             "content": response,
             "timestamp": datetime.now().isoformat()
         })
-        logging.debug(f"Assistant response for call_id={call_id}: {response}")
+        logging.debug("Assistant response for call_id=%s: %s", call_id, response, extra={"call_id": call_id, "event": "turn"})
         return response
 
-    async def text_to_speech(self, text: str) -> bytes:
+    async def text_to_speech(self, text: str, call_id: str = "") -> bytes:
+        pcm, sample_rate = await self.synthesize(text, call_id)
+        return pcm16_to_wav(pcm, sample_rate) if pcm.size else b""
+
+    async def synthesize(self, text: str, call_id: str = "") -> Tuple[np.ndarray, int]:
         try:
-            logging.info(f"Converting text to speech: {text[:60]}...")
-            temp_path = "temp_tts.wav"
-            self.tts.tts_to_file(text=text, file_path=temp_path)
-            with open(temp_path, "rb") as f:
-                audio_content = f.read()
-            os.remove(temp_path)
-            return audio_content
+            logging.info("Converting text to speech: %.60s...", text, extra={"call_id": call_id, "event": "tts"})
+            pcm, sample_rate = await self._run_job(call_id, self._synthesize, text)
+            conversation = self.active_conversations.get(call_id)
+            if conversation and pcm.size:
+                tokens = len(self.tokenizer(text, add_special_tokens=False).input_ids)
+                self.spoken_budget.observe(conversation.prompt_name, tokens, pcm.size / sample_rate)
+            return pcm, sample_rate
+        except Cancelled:
+            logging.info("TTS cancelled for call_id=%s", call_id, extra={"call_id": call_id})
+            raise
         except Exception as e:
-            logging.error(f"TTS error: {e}")
-            return b""
+            logging.error("TTS error: %s", e, extra={"call_id": call_id})
+            return np.zeros(0, dtype=np.int16), TTS_SAMPLE_RATE
+
+    def _synthesize(self, text: str, token: CancelToken) -> Tuple[np.ndarray, int]:
+        # Sentence by sentence, so a cancelled job stops at the next sentence boundary.
+        audio = []
+        for sentence in SENTENCE_END.split(text.strip()):
+            token.raise_if_cancelled()
+            audio.append(np.asarray(self.tts.tts(text=sentence), dtype=np.float32))
+        sample_rate = getattr(self.tts.synthesizer, "output_sample_rate", TTS_SAMPLE_RATE)
+        return float_to_pcm16(np.concatenate(audio)), sample_rate
 
-    async def speech_to_text(self, audio_data: bytes) -> str:
+    async def speech_to_text(self, audio_data: bytes, sample_rate: Optional[int] = None, call_id: str = "") -> str:
+        """`audio_data` is a WAV file, or raw 16-bit mono PCM when `sample_rate` is given."""
         try:
-            logging.info("Converting speech to text.")
-            temp_path = "temp_stt.wav"
-            with open(temp_path, "wb") as f:
-                f.write(audio_data)
-            wf = wave.open(temp_path, "rb")
-            rec = KaldiRecognizer(self.vosk_model, wf.getframerate())
-            result = ""
-            while True:
-                data = wf.readframes(4000)
-                if len(data) == 0:
-                    break
-                if rec.AcceptWaveform(data):
-                    res = rec.Result()
-                    result += json.loads(res).get("text", "")
-            res = rec.FinalResult()
-            result += json.loads(res).get("text", "")
-            wf.close()
-            os.remove(temp_path)
-            return result.strip()
+            logging.info("Converting speech to text.", extra={"call_id": call_id, "event": "stt"})
+            return await self._run_job(call_id, self._transcribe, audio_data, sample_rate)
+        except Cancelled:
+            logging.info("STT cancelled for call_id=%s", call_id, extra={"call_id": call_id})
+            raise
         except Exception as e:
-            logging.error(f"STT error: {e}")
+            logging.error("STT error: %s", e, extra={"call_id": call_id})
             return ""
 
+    def _transcribe(self, audio_data: bytes, sample_rate: Optional[int], token: CancelToken) -> str:
+        if sample_rate is None:
+            pcm, sample_rate = wav_to_pcm16(audio_data)
+            audio_data = pcm.tobytes()
+        rec = KaldiRecognizer(self.vosk_model, sample_rate)
+        result = ""
+        for offset in range(0, len(audio_data), STT_CHUNK_BYTES):
+            token.raise_if_cancelled()
+            if rec.AcceptWaveform(audio_data[offset:offset + STT_CHUNK_BYTES]):
+                result += json.loads(rec.Result()).get("text", "") + " "
+        result += json.loads(rec.FinalResult()).get("text", "")
+        return result.strip()
+
+    def metrics(self) -> Dict:
+        return {
+            "generation": self.speculative.metrics() if self.speculative else {},
+            "openers": self.openers.metrics(),
+            "knowledge": self.knowledge.metrics(),
+            "remote_llm": self.remote.metrics() if self.remote else {},
+        }
+
+    async def aclose(self):
+        if self.remote:
+            await self.remote.aclose()
+
     def end_conversation(self, call_id: str) -> Optional[Dict]:
+        self.cancel(call_id)
         conversation = self.active_conversations.get(call_id)
         if not conversation:
-            logging.warning(f"No conversation found to end for call_id={call_id}")
+            logging.warning("No conversation found to end for call_id=%s", call_id, extra={"call_id": call_id})
             return None
         summary = {
             "call_id": call_id,
-            "contact": conversation.contact,
+            "contact": asdict(conversation.contact),
             "duration": len(conversation.conversation_history),
             "opt_out_requested": conversation.opt_out_requested,
             "conversation_history": conversation.conversation_history
         }
         del self.active_conversations[call_id]
-        logging.info(f"Ended conversation for call_id={call_id}")
+        logging.info("Ended conversation for call_id=%s", call_id, extra={"call_id": call_id})
         return summary 
\ No newline at end of file
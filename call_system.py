@@ -2,27 +2,46 @@ import asyncio
 import csv
 import json
 import logging
-import re
-import sys
-from datetime import datetime, time
+import os
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 import pytz
 from dataclasses import asdict
+from admission import AdaptiveLimiter
+from compliance import (
+    BLOCK_DNC, BLOCK_NO_CONSENT, BLOCK_OPTED_OUT, BLOCK_OUTSIDE_HOURS, DNC_FILE,
+    block_reason, load_dnc_list, normalize_phone, within_calling_hours,
+)
 from config import Config
-from models import Contact, CallStatus
+from models import CONTACT_FIELDS, Contact, CallStatus
+from structured_logging import setup_logging
 from ai_manager import AIConversationManager
+from media_server import MediaServer
 from telephony import initiate_call
 
 class CallSystem:
-    def __init__(self):
-        self.config = Config()
+    def __init__(self, config: Optional[Config] = None, dnc_file: str = DNC_FILE):
+        self.config = config or Config()
         self.validate_config()
         self.setup_logging()
         self.ai_manager = AIConversationManager(self.config)
-        self.dnc_numbers = self.load_dnc_list()
+        self.dnc_numbers = self.load_dnc_list(dnc_file)
         self.timezone = pytz.timezone(self.config.timezone)
-        self.semaphore = asyncio.Semaphore(self.config.max_concurrent_calls)
+        self.limiter = AdaptiveLimiter(
+            self.config.max_concurrent_calls,
+            minimum=self.config.min_concurrent_calls,
+            maximum=self.config.concurrency_ceiling or 4 * self.config.max_concurrent_calls,
+            latency_slo=self.config.turn_latency_slo,
+            queue_depth=self.ai_manager.cancellation.total,
+            max_queue_depth=self.config.max_model_queue or 2 * (os.cpu_count() or 1),
+            adaptive=self.config.adaptive_concurrency,
+        )
+        self.media_server = MediaServer(self.ai_manager, self.config)
+        self.media_server.latency_listeners.append(self.limiter.observe)
+        self.media_server.metrics_sources["admission"] = self.limiter.metrics
+        self.dial = initiate_call
+        self.pregeneration = None
         logging.info("CallSystem initialized.")
 
     def validate_config(self):
@@ -37,46 +56,33 @@ class CallSystem:
         logging.info("Config validated.")
 
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(sys.stdout),
-                logging.FileHandler('calling_system.log')
-            ]
-        )
+        self.log_listener = setup_logging(self.config)
         self.logger = logging.getLogger(__name__)
         logging.info("Logging setup complete.")
 
-    def load_dnc_list(self) -> set:
-        dnc_file = Path("dnc_list.txt")
-        if dnc_file.exists():
-            dnc_numbers = {line.strip() for line in dnc_file.read_text().splitlines() if line.strip()}
+    def load_dnc_list(self, path: str = DNC_FILE) -> set:
+        dnc_numbers = load_dnc_list(path)
+        if dnc_numbers:
             logging.info(f"Loaded {len(dnc_numbers)} DNC numbers.")
-            return dnc_numbers
-        logging.info("No DNC list found.")
-        return set()
+        else:
+            logging.info("No DNC list found.")
+        return dnc_numbers
 
     def normalize_phone(self, phone: str) -> str:
-        digits = re.sub(r'\D', '', phone)
-        if len(digits) == 10:
-            digits = '1' + digits
-        normalized = '+' + digits
-        logging.debug(f"Normalized phone {phone} to {normalized}")
+        normalized = normalize_phone(phone)
+        logging.debug("Normalized phone %s to %s", phone, normalized)
         return normalized
 
     def is_callable(self, contact: Contact) -> bool:
-        if not contact.consent_obtained or contact.opt_out_date:
-            logging.info(f"Contact {contact.phone_number} not callable: consent={contact.consent_obtained}, opt_out_date={contact.opt_out_date}")
-            return False
-        if self.normalize_phone(contact.phone_number) in self.dnc_numbers:
-            logging.info(f"Contact {contact.phone_number} is on DNC list.")
-            return False
-        current_time = datetime.now(self.timezone).time()
-        within_hours = (time(self.config.calling_hours_start, 0) <= current_time <=
-                time(self.config.calling_hours_end, 0))
-        logging.debug(f"Current time {current_time}, within calling hours: {within_hours}")
-        return within_hours
+        reason = block_reason(contact, self.dnc_numbers, self.config)
+        if reason in (BLOCK_NO_CONSENT, BLOCK_OPTED_OUT):
+            logging.info("Contact %s not callable: consent=%s, opt_out_date=%s", contact.phone_number,
+                         contact.consent_obtained, contact.opt_out_date, extra={"event": "screening"})
+        elif reason == BLOCK_DNC:
+            logging.info("Contact %s is on DNC list.", contact.phone_number, extra={"event": "screening"})
+        elif reason == BLOCK_OUTSIDE_HOURS:
+            logging.debug("Contact %s outside calling hours", contact.phone_number, extra={"event": "screening"})
+        return reason is None
 
     def load_contacts(self) -> List[Contact]:
         csv_file = Path(self.config.csv_file)
@@ -103,15 +109,13 @@ class CallSystem:
         return contacts
 
     def create_csv(self):
-        headers = ['phone_number', 'name', 'email', 'company', 'status', 'call_attempts', 'consent_obtained', 'opt_out_date', 'prompt_name']
         with open(self.config.csv_file, 'w', newline='') as f:
-            csv.DictWriter(f, fieldnames=headers).writeheader()
-        logging.info(f"Created contacts CSV with headers: {headers}")
+            csv.DictWriter(f, fieldnames=CONTACT_FIELDS).writeheader()
+        logging.info(f"Created contacts CSV with headers: {CONTACT_FIELDS}")
 
     def save_contacts(self, contacts: List[Contact]):
-        headers = ['phone_number', 'name', 'email', 'company', 'status', 'call_attempts', 'consent_obtained', 'opt_out_date', 'prompt_name']
         with open(self.config.csv_file, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=headers)
+            writer = csv.DictWriter(f, fieldnames=CONTACT_FIELDS)
             writer.writeheader()
             for contact in contacts:
                 writer.writerow(asdict(contact))
@@ -146,19 +150,33 @@ class CallSystem:
             self.logger.info("These contacts will use the 'default' prompt")
 
     async def make_call(self, contact: Contact) -> dict:
-        async with self.semaphore:
+        async with self.limiter.slot() as admitted:
+            if not admitted:
+                # Over the latency SLO: leave the contact pending for a later session.
+                return {"status": "deferred", "phone": contact.phone_number}
             call_id = f"call_{contact.phone_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             try:
                 if not self.is_callable(contact):
                     return {"status": "blocked", "phone": contact.phone_number}
                 self.update_contact_status(contact.phone_number, CallStatus.CALLING.value, True)
                 conversation = await self.ai_manager.start_conversation(contact, call_id)
-                twiml_url = f"https://yourapp.com/twiml/{call_id}"  # Placeholder, should point to your TwiML handler
-                call_sid = initiate_call(contact, call_id, self.config, twiml_url)
-                await asyncio.sleep(2)
+                self.media_server.expect_call(call_id)
+                # The provider's REST client blocks; keep it off the loop that carries live audio.
+                call_sid = await asyncio.to_thread(
+                    self.dial, contact, call_id, self.config, self.media_server.twiml_url(call_id)
+                )
+                # Ringing is bounded by the provider's own answer timeout; only an answered
+                # call gets max_call_duration.
+                answered = await self.media_server.wait_for_answer(call_id, self.config.conversation_timeout)
+                if answered:
+                    await self.media_server.wait_for_call(call_id, self.config.max_call_duration)
                 conversation_summary = self.ai_manager.end_conversation(call_id)
                 if conversation_summary:
                     self.save_conversation_log(conversation_summary)
+                if not answered:
+                    # The attempt is already counted; leave the contact to be redialed.
+                    self.update_contact_status(contact.phone_number, CallStatus.PENDING.value)
+                    return {"status": "no_answer", "phone": contact.phone_number, "call_sid": call_sid}
                 final_status = CallStatus.OPTED_OUT.value if conversation.opt_out_requested else CallStatus.COMPLETED.value
                 self.update_contact_status(contact.phone_number, final_status)
                 return {
@@ -169,13 +187,22 @@ class CallSystem:
                     "opt_out": conversation.opt_out_requested
                 }
             except Exception as e:
-                self.logger.error(f"Call failed {contact.phone_number}: {e}")
+                self.logger.error(f"Call failed {contact.phone_number}: {e}", extra={"call_id": call_id})
+                self.media_server.forget_call(call_id)
+                if call_id in self.ai_manager.active_conversations:
+                    self.ai_manager.end_conversation(call_id)
                 self.update_contact_status(contact.phone_number, CallStatus.FAILED.value)
                 return {"status": "failed", "phone": contact.phone_number, "error": str(e)}
 
     async def run_calling_session(self):
+        if self.pregeneration:
+            self.pregeneration.cancel()
         contacts = [c for c in self.load_contacts() if c.status == CallStatus.PENDING.value]
-        callable_contacts = [c for c in contacts if self.is_callable(c)][:self.config.max_concurrent_calls]
+        queue = [c for c in contacts if self.is_callable(c)]
+        if queue and not self.limiter.headroom:
+            self.logger.info(f"Not starting calls: admission {self.limiter.metrics()}")
+            return
+        callable_contacts = queue[:self.limiter.headroom]
         if not callable_contacts:
             self.logger.info("No callable contacts")
             return
@@ -184,7 +211,14 @@ class CallSystem:
         results = await asyncio.gather(*tasks, return_exceptions=True)
         successful = sum(1 for r in results if isinstance(r, dict) and r.get("status") == "success")
         opt_outs = sum(1 for r in results if isinstance(r, dict) and r.get("opt_out"))
-        self.logger.info(f"Session complete: {successful}/{len(results)} successful, {opt_outs} opt-outs")
+        deferred = sum(1 for r in results if isinstance(r, dict) and r.get("status") == "deferred")
+        unanswered = sum(1 for r in results if isinstance(r, dict) and r.get("status") == "no_answer")
+        self.logger.info(f"Session complete: {successful}/{len(results)} successful, {opt_outs} opt-outs, "
+                         f"{unanswered} unanswered, {deferred} deferred")
+        upcoming = queue[len(callable_contacts):len(callable_contacts) + self.config.pregenerate_contacts]
+        if upcoming and not self.limiter.shedding:
+            # Lines are idle until the next session: render that session's openers now.
+            self.pregeneration = asyncio.ensure_future(self.ai_manager.pregenerate_openers(upcoming))
 
     async def run(self):
         self.logger.info("Starting LLM-Powered Cold Calling System")
@@ -194,6 +228,12 @@ class CallSystem:
         prompts_dir = Path(self.config.prompts_dir)
         self.logger.info(f"Prompt files location: {prompts_dir.absolute()}")
         self.logger.info("To add new prompts: create new .txt files in the prompts directory")
+        await self.media_server.start()
+        prompt_watcher = None
+        if self.config.prompt_reload_interval > 0:
+            prompt_watcher = asyncio.ensure_future(
+                self.ai_manager.prompt_store.watch(self.config.prompt_reload_interval)
+            )
         try:
             while True:
                 if self.is_calling_hours_active():
@@ -204,8 +244,13 @@ class CallSystem:
                     await asyncio.sleep(3600)
         except KeyboardInterrupt:
             self.logger.info("Shutting down")
+        finally:
+            if prompt_watcher:
+                prompt_watcher.cancel()
+            if self.pregeneration:
+                self.pregeneration.cancel()
+            await self.media_server.stop()
+            await self.ai_manager.aclose()
 
     def is_calling_hours_active(self) -> bool:
-        current_time = datetime.now(self.timezone).time()
-        return (time(self.config.calling_hours_start, 0) <= current_time <=
-                time(self.config.calling_hours_end, 0)) 
\ No newline at end of file
+        return within_calling_hours(self.config)
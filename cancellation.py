@@ -0,0 +1,79 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Set
+
+
+class Cancelled(Exception):
+    """Raised inside a model job whose call hung up or moved on."""
+
+
+class CancelToken:
+    """Checked by blocking model code at safe points (between tokens, sentences or audio chunks)."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """For code that waits rather than polls: `callback` runs on cancel (at once if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+
+class CancellationRegistry:
+    """Tokens of the model jobs currently queued or running, grouped by call_id."""
+
+    def __init__(self):
+        self._tokens: Dict[str, Set[CancelToken]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def job(self, call_id: str) -> Iterator[CancelToken]:
+        token = CancelToken()
+        with self._lock:
+            self._tokens[call_id].add(token)
+        try:
+            yield token
+        finally:
+            with self._lock:
+                tokens = self._tokens.get(call_id)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._tokens[call_id]
+
+    def cancel(self, call_id: str) -> int:
+        with self._lock:
+            tokens = self._tokens.pop(call_id, set())
+        for token in tokens:
+            token.cancel()
+        return len(tokens)
+
+    def pending(self, call_id: str) -> int:
+        with self._lock:
+            return len(self._tokens.get(call_id, ()))
+
+    def total(self) -> int:
+        """Model jobs queued or running across all calls."""
+        with self._lock:
+            return sum(len(tokens) for tokens in self._tokens.values())
@@ -0,0 +1,380 @@
+import heapq
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import count
+from typing import Callable, Dict, Iterable, List, Optional, Union
+import numpy as np
+import pytz
+from admission import ADJUST_INTERVAL, AdaptiveLimiter
+from config import Config
+
+DAY = 86400
+SESSION_INTERVAL = 300  # CallSystem.run sleeps this long after every calling session
+IDLE_INTERVAL = 3600  # ...and this long when outside calling hours
+
+# Rough single-core figures; replace with a profile measured on the target host.
+DEFAULT_PROFILE = {
+    "llm": [2.5],
+    "tts": [1.5],
+    "stt": [0.4],
+    "provider": [0.6],
+    "ring_seconds": [12],
+    "turns": [4],
+    "caller_speech_seconds": [4],
+    "agent_speech_seconds": [6],
+    "answer_rate": 0.25,
+    "retry_decay": 0.8,
+}
+
+
+def load_profile(path: Optional[str] = None) -> Dict[str, Union[float, List[float]]]:
+    """
+    Stage costs in seconds. Each entry is a number or a list of samples (e.g. per-call
+    measurements from a benchmark run), drawn from with replacement during simulation.
+    Missing entries fall back to DEFAULT_PROFILE.
+    """
+    profile = dict(DEFAULT_PROFILE)
+    if path:
+        with open(path) as f:
+            profile.update(json.load(f))
+    return profile
+
+
+class _Event:
+    def __init__(self, sim: "Simulation"):
+        self.sim = sim
+        self.triggered = False
+        self.callbacks: List[Callable[[], None]] = []
+
+    def succeed(self):
+        self.triggered = True
+        for callback in self.callbacks:
+            self.sim.schedule(0, callback)
+        self.callbacks = []
+
+
+class Simulation:
+    """Minimal discrete-event kernel: processes are generators that yield events to wait on."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._queue = []
+        self._order = count()
+
+    def schedule(self, delay: float, callback: Callable[[], None]):
+        heapq.heappush(self._queue, (self.now + delay, next(self._order), callback))
+
+    def timeout(self, delay: float) -> _Event:
+        event = _Event(self)
+        self.schedule(delay, event.succeed)
+        return event
+
+    def all_of(self, events: List[_Event]) -> _Event:
+        done = _Event(self)
+        remaining = [len(events)]
+
+        def one_done():
+            remaining[0] -= 1
+            if not remaining[0]:
+                done.succeed()
+        for event in events:
+            self._wait(event, one_done)
+        if not events:
+            done.succeed()
+        return done
+
+    def start(self, process) -> _Event:
+        finished = _Event(self)
+
+        def step():
+            try:
+                event = next(process)
+            except StopIteration:
+                finished.succeed()
+                return
+            self._wait(event, step)
+        self.schedule(0, step)
+        return finished
+
+    def _wait(self, event: _Event, callback: Callable[[], None]):
+        if event.triggered:
+            self.schedule(0, callback)
+        else:
+            event.callbacks.append(callback)
+
+    def run(self, until: float):
+        while self._queue and self._queue[0][0] <= until:
+            self.now, _, callback = heapq.heappop(self._queue)
+            callback()
+        self.now = until
+
+
+class Resource:
+    """`capacity` identical servers with a FIFO queue; tracks busy-time for utilization."""
+
+    def __init__(self, sim: Simulation, capacity: int):
+        self.sim = sim
+        self.capacity = capacity
+        self.busy = 0
+        self.waiting: List[_Event] = []
+        self.busy_seconds = 0.0
+        self._since = 0.0
+
+    def _account(self):
+        self.busy_seconds += self.busy * (self.sim.now - self._since)
+        self._since = self.sim.now
+
+    def acquire(self) -> _Event:
+        event = _Event(self.sim)
+        if self.busy < self.capacity:
+            self._account()
+            self.busy += 1
+            event.succeed()
+        else:
+            self.waiting.append(event)
+        return event
+
+    def release(self):
+        if self.waiting:
+            self.waiting.pop(0).succeed()
+        else:
+            self._account()
+            self.busy -= 1
+
+
+@dataclass
+class Workload:
+    """The callable part of a contact list: how many, where they are and how often they were tried."""
+    contacts: int
+    timezones: Dict[str, float] = field(default_factory=dict)
+    attempts: Dict[int, float] = field(default_factory=lambda: {0: 1.0})
+
+
+@dataclass
+class CapacityForecast:
+    cores: int
+    lines: int
+    ceiling: int
+    days: int
+    dialed: int
+    connected: int
+    off_hours: int
+    peak_limit: int
+    line_utilization: float
+    core_utilization: float
+    line_seconds: Dict[str, float]
+    bottleneck: str
+
+    @property
+    def calls_per_day(self) -> float:
+        return self.dialed / self.days
+
+    @property
+    def connected_per_day(self) -> float:
+        return self.connected / self.days
+
+    def share(self, name: str) -> float:
+        total = sum(self.line_seconds.values())
+        return self.line_seconds.get(name, 0.0) / total if total else 0.0
+
+
+# Line time that no amount of hardware removes: the conversation itself, rings nobody
+# answers (set by the contact list) and admitted lines left unused between sessions.
+# Everything else is a stage, and a bottleneck candidate.
+CONVERSATION = ("ring", "caller_speech", "agent_speech")
+NOT_STAGES = CONVERSATION + ("no_answer", "idle")
+
+
+class CallSystemModel:
+    """
+    Discrete-event model of CallSystem.run on one host:
+
+    - every SESSION_INTERVAL (IDLE_INTERVAL outside calling hours) a session takes as many
+      callable contacts, in list order, as the AdaptiveLimiter has headroom for and waits
+      for all of those calls to end;
+    - the limiter is CallSystem's own, on the simulated clock: it starts at `lines`
+      (MAX_CONCURRENT_CALLS), grows towards CONCURRENCY_CEILING while turn latency is under
+      TURN_LATENCY_SLO and is cut, or sheds whole sessions, when latency or the model queue
+      is over its limit;
+    - each call holds a line from start to finish: opening line (LLM), dial (provider API,
+      called from a worker thread), then either no answer (the line is held for
+      conversation_timeout, while the phone rings) or a conversation of
+      greeting + turns, each turn being caller speech, VAD hangover, STT, LLM, TTS and
+      playback, cut off max_call_duration after the answer;
+    - LLM/TTS/STT calls queue for `cores` workers and take their measured time once running.
+
+    Like compliance.within_calling_hours, only the system timezone decides whether it is
+    calling hours; a contact's own timezone does not hold it back. Calls that reach a
+    contact outside calling hours in their timezone are counted as `off_hours`.
+    """
+
+    def __init__(self, config: Config, profile: Dict, workload: Workload, cores: int,
+                 lines: Optional[int] = None, start_hour: float = 0.0, seed: int = 0,
+                 date: Optional[datetime] = None):
+        self.config = config
+        self.profile = profile
+        self.workload = workload
+        self.cores = cores
+        self.lines = lines or config.max_concurrent_calls
+        self.start_hour = start_hour
+        self.rng = np.random.default_rng(seed)
+        self._samples = {
+            name: np.atleast_1d(np.asarray(value, dtype=float))
+            for name, value in profile.items() if name not in ("answer_rate", "retry_decay")
+        }
+        self._offsets = self._timezone_offsets(date or datetime.now())
+        self._assign_contacts()
+
+    def _timezone_offsets(self, date: datetime) -> np.ndarray:
+        """Hours each contact timezone is ahead of the system timezone on `date`."""
+        system = pytz.timezone(self.config.timezone).utcoffset(date)
+        names = list(self.workload.timezones) or [self.config.timezone]
+        self._timezone_names = names
+        return np.array([(pytz.timezone(name).utcoffset(date) - system).total_seconds() / 3600 for name in names])
+
+    def _assign_contacts(self):
+        size = self.workload.contacts
+        weights = np.array([self.workload.timezones.get(name, 1.0) for name in self._timezone_names], dtype=float)
+        zones = self.rng.choice(len(weights), size=size, p=weights / weights.sum())
+        attempts = np.array(list(self.workload.attempts), dtype=float)
+        attempt_weights = np.array(list(self.workload.attempts.values()), dtype=float)
+        self._attempts = self.rng.choice(attempts, size=size, p=attempt_weights / attempt_weights.sum())
+        self._zones = zones
+        self._cursor = 0  # the next undialed contact, in list order
+
+    def _sample(self, name: str) -> float:
+        samples = self._samples[name]
+        return float(samples[self.rng.integers(samples.size)]) if samples.size > 1 else float(samples[0])
+
+    def _local_hours(self, offset: float = 0.0) -> float:
+        return (self.start_hour + self.sim.now / 3600 + offset) % 24
+
+    def _within_hours(self, offset: float = 0.0) -> bool:
+        return self.config.calling_hours_start <= self._local_hours(offset) <= self.config.calling_hours_end
+
+    def _next_contacts(self, limit: int) -> List[int]:
+        batch = list(range(self._cursor, min(self._cursor + limit, self.workload.contacts)))
+        self._cursor += len(batch)
+        return batch
+
+    def _compute(self, stage: str):
+        queued = self.sim.now
+        yield self.compute.acquire()
+        self.line_seconds["core_queue"] += self.sim.now - queued
+        duration = self._sample(stage)
+        yield self.sim.timeout(duration)
+        self.compute.release()
+        self.line_seconds[stage] += duration
+
+    def _spend(self, name: str, duration: float):
+        self.line_seconds[name] += duration
+        return self.sim.timeout(duration)
+
+    def _call(self, contact: int):
+        yield self.lines_in_use.acquire()
+        self.limiter.in_flight += 1
+        yield from self._compute("llm")
+        yield self._spend("provider", self._sample("provider"))
+        self.dialed += 1
+        if not self._within_hours(self._offsets[self._zones[contact]]):
+            self.off_hours += 1
+        answer_rate = self.profile["answer_rate"] * self.profile["retry_decay"] ** self._attempts[contact]
+        if self.rng.random() >= answer_rate:
+            yield self._spend("no_answer", self.config.conversation_timeout)
+        else:
+            self.connected += 1
+            yield self._spend("ring", min(self._sample("ring_seconds"), self.config.conversation_timeout))
+            deadline = self.sim.now + self.config.max_call_duration
+            turns = max(0, int(round(self._sample("turns"))))
+            yield from self._compute("tts")
+            yield self._spend("agent_speech", self._sample("agent_speech_seconds"))
+            for _ in range(turns):
+                if self.sim.now >= deadline:
+                    break
+                yield self._spend("caller_speech", self._sample("caller_speech_seconds") + self.config.vad_hangover_ms / 1000)
+                replying = self.sim.now
+                for stage in ("stt", "llm", "tts"):
+                    yield from self._compute(stage)
+                self.limiter.observe(self.sim.now - replying)
+                yield self._spend("agent_speech", self._sample("agent_speech_seconds"))
+        self.limiter.in_flight -= 1
+        self.lines_in_use.release()
+
+    def _dialer(self):
+        while True:
+            if self._within_hours():
+                batch = self._next_contacts(self.limiter.headroom)
+                yield self.sim.all_of([self.sim.start(self._call(contact)) for contact in batch])
+                yield self.sim.timeout(SESSION_INTERVAL)
+            else:
+                yield self.sim.timeout(IDLE_INTERVAL)
+
+    def _admitted_lines(self):
+        """Line-seconds the limiter allows during calling hours, sampled as often as it can change."""
+        while True:
+            yield self.sim.timeout(ADJUST_INTERVAL)
+            limit = int(self.limiter.limit)
+            self.peak_limit = max(self.peak_limit, limit)
+            if self._within_hours():
+                self.admitted_seconds += limit * ADJUST_INTERVAL
+
+    def run(self, days: int = 1) -> CapacityForecast:
+        self.sim = Simulation()
+        self.limiter = AdaptiveLimiter(
+            self.lines,
+            minimum=self.config.min_concurrent_calls,
+            maximum=self.config.concurrency_ceiling or 4 * self.lines,
+            latency_slo=self.config.turn_latency_slo,
+            queue_depth=lambda: self.compute.busy + len(self.compute.waiting),
+            max_queue_depth=self.config.max_model_queue or 2 * self.cores,
+            adaptive=self.config.adaptive_concurrency,
+            clock=lambda: self.sim.now,
+        )
+        self.lines_in_use = Resource(self.sim, self.limiter.maximum)
+        self.compute = Resource(self.sim, self.cores)
+        self.line_seconds: Dict[str, float] = defaultdict(float)
+        self.dialed = self.connected = self.off_hours = 0
+        self.admitted_seconds = 0.0
+        self.peak_limit = int(self.limiter.limit)
+        self.sim.start(self._dialer())
+        self.sim.start(self._admitted_lines())
+        previous = logging.root.manager.disable
+        logging.disable(logging.WARNING)  # the limiter's shedding notices, thousands per simulated day
+        try:
+            self.sim.run(days * DAY)
+        finally:
+            logging.disable(previous)
+        self.lines_in_use._account()
+        self.compute._account()
+
+        window = days * 3600 * (self.config.calling_hours_end - self.config.calling_hours_start)
+        line_seconds = dict(self.line_seconds)
+        line_seconds["idle"] = max(0.0, self.admitted_seconds - self.lines_in_use.busy_seconds)
+        candidates = {name: seconds for name, seconds in line_seconds.items() if name not in NOT_STAGES}
+        return CapacityForecast(
+            cores=self.cores,
+            lines=self.lines,
+            ceiling=self.limiter.maximum,
+            days=days,
+            dialed=self.dialed,
+            connected=self.connected,
+            off_hours=self.off_hours,
+            peak_limit=self.peak_limit,
+            line_utilization=min(1.0, self.lines_in_use.busy_seconds / self.admitted_seconds) if self.admitted_seconds else 0.0,
+            core_utilization=min(1.0, self.compute.busy_seconds / (window * self.cores)) if window else 0.0,
+            line_seconds=line_seconds,
+            bottleneck=max(candidates, key=candidates.get) if candidates else "",
+        )
+
+
+def forecast(config: Config, profile: Dict, workload: Workload, cores: Iterable[int],
+             lines: Iterable[Optional[int]] = (None,), days: int = 1, start_hour: float = 0.0,
+             seed: int = 0) -> List[CapacityForecast]:
+    """One simulated run per (cores, lines) combination, all with the same contact list and seed."""
+    return [
+        CallSystemModel(config, profile, workload, core_count, line_count, start_hour, seed).run(days)
+        for core_count in cores for line_count in lines
+    ]
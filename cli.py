@@ -0,0 +1,266 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+import numpy as np
+import pytz
+from compliance import (
+    BLOCK_DNC, BLOCK_NO_CONSENT, BLOCK_OPTED_OUT, BLOCK_OUTSIDE_HOURS,
+    DNC_FILE, load_dnc_list, within_calling_hours,
+)
+from config import Config
+from contact_table import ContactTable, normalize_phone_set
+from models import CallStatus
+
+if TYPE_CHECKING:
+    from capacity import Workload
+
+# Everything here must stay importable without torch/transformers/TTS:
+# only the `run` command pulls in the dialer. Start-up time counts on big lists, so
+# modules only one command needs (prompt_store, capacity, knowledge_base, lead_import)
+# are imported by it.
+
+EXAMPLES = 5
+
+
+def _print_counts(title: str, counts: dict):
+    print(title)
+    for key, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"  {key or '(empty)'}: {count}")
+
+
+def _examples(table: ContactTable, mask: np.ndarray, column: str = "phone_number") -> str:
+    rows = np.flatnonzero(mask)[:EXAMPLES]
+    return ", ".join(table.text(column, int(row)) for row in rows)
+
+
+def _available_prompts(config: Config) -> List[str]:
+    return sorted(path.stem for path in Path(config.prompts_dir).glob("*.txt"))
+
+
+def validate(config: Config, table: ContactTable, dnc: np.ndarray) -> int:
+    from prompt_store import validate_template
+    errors = 0
+    prompts = _available_prompts(config)
+    print(f"Prompts ({len(prompts)}) in {Path(config.prompts_dir).resolve()}")
+    valid_prompts = set()
+    for prompt_name in prompts:
+        try:
+            variables = validate_template((Path(config.prompts_dir) / f"{prompt_name}.txt").read_text().strip())
+            valid_prompts.add(prompt_name)
+            print(f"  ok     {prompt_name} ({', '.join(sorted(variables)) or 'no variables'})")
+        except ValueError as e:
+            errors += 1
+            print(f"  error  {prompt_name}: {e}")
+    if "default" not in valid_prompts:
+        print("  warning: no valid 'default' prompt; contacts with unknown prompts have no fallback")
+
+    print(f"Contacts: {len(table)}")
+    numbers, valid = table.phones()
+    if not valid.all():
+        errors += 1
+        print(f"  error  {int((~valid).sum())} invalid phone numbers, e.g. {_examples(table, ~valid)}")
+    ordered = np.sort(numbers[valid])
+    repeated = ordered[1:][ordered[1:] == ordered[:-1]]
+    if repeated.size:
+        # Examples are the first row of each repeated number; only those rows are searched.
+        rows = np.flatnonzero(valid & np.isin(numbers, repeated))
+        _, first_index = np.unique(numbers[rows], return_index=True)
+        duplicated = np.zeros(len(table), dtype=bool)
+        duplicated[rows[first_index]] = True
+        print(f"  warning {repeated.size} duplicate phone numbers, e.g. {_examples(table, duplicated)}")
+    unknown = {name: count for name, count in table.value_counts("prompt_name").items() if name not in valid_prompts}
+    if unknown:
+        print(f"  warning {sum(unknown.values())} contacts use unknown prompts ({', '.join(unknown)}); they will use 'default'")
+    pending = table.equals("status", CallStatus.PENDING.value)
+    no_consent = pending & ~table.consent()
+    if no_consent.any():
+        print(f"  warning {int(no_consent.sum())} pending contacts have no recorded consent and will never be dialed")
+    on_dnc = pending & np.isin(numbers, dnc)
+    if on_dnc.any():
+        print(f"  warning {int(on_dnc.sum())} pending contacts are on the DNC list, e.g. {_examples(table, on_dnc)}")
+    print("Validation failed." if errors else "Validation passed.")
+    return 1 if errors else 0
+
+
+def block_reasons(config: Config, table: ContactTable, dnc: np.ndarray, now: datetime) -> dict:
+    """Vectorized compliance.block_reason: a mask per reason, applied in the same order."""
+    consent = table.consent()
+    opted_out = consent & (table.lengths("opt_out_date") > 0)
+    remaining = consent & ~opted_out
+    numbers, _ = table.phones()
+    on_dnc = remaining & np.isin(numbers, dnc)
+    remaining &= ~on_dnc
+    outside = remaining if not within_calling_hours(config, now) else np.zeros(len(table), dtype=bool)
+    return {
+        BLOCK_NO_CONSENT: ~consent,
+        BLOCK_OPTED_OUT: opted_out,
+        BLOCK_DNC: on_dnc,
+        BLOCK_OUTSIDE_HOURS: outside,
+        None: remaining & ~outside,
+    }
+
+
+def dry_run(config: Config, table: ContactTable, dnc: np.ndarray, now: datetime, limit: int) -> int:
+    pending_mask = table.equals("status", CallStatus.PENDING.value)
+    pending = table.where(pending_mask)
+    print(f"Now: {now.strftime('%Y-%m-%d %H:%M %Z')} (calling hours {config.calling_hours_start}:00-{config.calling_hours_end}:00)")
+    print(f"Contacts: {len(table)}, pending: {len(pending)}, not pending: {len(table) - len(pending)}")
+    reasons = block_reasons(config, pending, dnc, now)
+    callable_rows = np.flatnonzero(reasons.pop(None))
+    _print_counts("Blocked:", {reason: int(mask.sum()) for reason, mask in reasons.items()})
+    print(f"Would dial now ({min(limit, callable_rows.size)} of {callable_rows.size} callable):")
+    for row in callable_rows[:limit]:
+        row = int(row)
+        print(f"  {pending.text('phone_number', row)}  {pending.text('name', row)}  prompt={pending.text('prompt_name', row)}")
+    return 0
+
+
+def stats(config: Config, table: ContactTable) -> int:
+    print(f"Contacts: {len(table)}")
+    _print_counts("Status:", table.value_counts("status"))
+    consent = table.consent()
+    print(f"Consent: {int(consent.sum())} obtained, {int((~consent).sum())} missing")
+    print(f"Opted out: {int((table.lengths('opt_out_date') > 0).sum())}")
+    _print_counts("Call attempts:", table.value_counts("call_attempts"))
+    _print_counts("Prompts:", table.value_counts("prompt_name"))
+    return 0
+
+
+def import_file(config: Config, args: argparse.Namespace, dnc: np.ndarray) -> int:
+    from lead_import import CHUNK_BYTES, import_leads
+    print(f"Importing {args.source} into {config.csv_file}")
+    report = import_leads(args.source, config.csv_file, dnc, workers=args.workers,
+                          chunk_bytes=args.chunk_mb * 1024 * 1024 if args.chunk_mb else CHUNK_BYTES, prompt_name=args.prompt)
+    print(f"Rows: {report.rows} in {report.seconds:.2f}s ({report.rows_per_second:,.0f} rows/s)")
+    print(f"Accepted: {report.accepted}")
+    _print_counts("Rejected:", report.rejected)
+    return 0
+
+
+def index_knowledge(config: Config, args: argparse.Namespace) -> int:
+    from knowledge_base import CHUNK_WORDS, KnowledgeBase, build_index, knowledge_prompts
+    available = knowledge_prompts(config.knowledge_dir)
+    if args.prompt and args.prompt not in available:
+        print(f"No knowledge directory {Path(config.knowledge_dir).resolve() / args.prompt} "
+              f"(available: {', '.join(available) or 'none'})")
+        return 1
+    prompts = [args.prompt] if args.prompt else available
+    if not prompts:
+        print(f"No knowledge directories in {Path(config.knowledge_dir).resolve()} (expected one per prompt)")
+        return 1
+    if args.query:
+        knowledge = KnowledgeBase(config.knowledge_dir, config.knowledge_top_k, config.knowledge_min_score)
+        for prompt_name in prompts:
+            snippets = knowledge.search(prompt_name, args.query)
+            print(f"{prompt_name}: {len(snippets)} snippets in {knowledge.metrics()['avg_ms']} ms")
+            for snippet in snippets:
+                print(f"  {snippet.score:.2f} [{snippet.source}] {snippet.text}")
+        return 0
+    for prompt_name in prompts:
+        files, chunks = build_index(config.knowledge_dir, prompt_name, args.chunk_words or CHUNK_WORDS)
+        print(f"{prompt_name}: {chunks} chunks from {files} files")
+    return 0
+
+
+def workload(config: Config, table: ContactTable, dnc: np.ndarray) -> "Workload":
+    """Pending contacts that pass every check except calling hours, which the planner simulates."""
+    from capacity import Workload
+    pending = table.where(table.equals("status", CallStatus.PENDING.value))
+    reasons = block_reasons(config, pending, dnc, datetime.now(pytz.timezone(config.timezone)))
+    callable_contacts = pending.where(reasons[None] | reasons[BLOCK_OUTSIDE_HOURS])
+    timezones = callable_contacts.value_counts("timezone") if "timezone" in table.sources else {}
+    attempts = {int(value or 0): count for value, count in callable_contacts.value_counts("call_attempts").items()}
+    return Workload(len(callable_contacts), {name or config.timezone: count for name, count in timezones.items()},
+                    attempts or {0: 1})
+
+
+def plan(config: Config, args: argparse.Namespace, table: ContactTable, dnc: np.ndarray) -> int:
+    from capacity import forecast, load_profile
+    contacts = workload(config, table, dnc)
+    print(f"Callable contacts: {contacts.contacts}")
+    if contacts.timezones:
+        _print_counts("Timezones:", contacts.timezones)
+    results = forecast(config, load_profile(args.profile), contacts, args.cores, args.lines or [None],
+                       days=args.days, start_hour=args.start_hour, seed=args.seed)
+    print(f"{'cores':>5} {'lines':>5} {'peak':>5} {'calls/day':>10} {'connected/day':>14} {'off-hours':>9} "
+          f"{'line util':>9} {'core util':>9} {'idle':>5} {'no answer':>9}  bottleneck")
+    for result in results:
+        print(f"{result.cores:>5} {result.lines:>5} {result.peak_limit:>5} {result.calls_per_day:>10.0f} "
+              f"{result.connected_per_day:>14.0f} {result.off_hours / result.days:>9.0f} {result.line_utilization:>9.0%} "
+              f"{result.core_utilization:>9.0%} {result.share('idle'):>5.0%} {result.share('no_answer'):>9.0%}  "
+              f"{result.bottleneck}")
+    for result in results:
+        total = sum(result.line_seconds.values()) or 1
+        breakdown = ", ".join(f"{name} {seconds / total:.0%}" for name, seconds in
+                              sorted(result.line_seconds.items(), key=lambda item: -item[1]) if seconds)
+        print(f"Line time at {result.cores} cores, {result.lines} lines: {breakdown}")
+    return 0
+
+
+def run(config: Config, dnc_file: str) -> int:
+    import asyncio
+    from call_system import CallSystem
+    system = CallSystem(config, dnc_file)
+    asyncio.run(system.run())
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="AI-Powered Cold Calling System")
+    parser.add_argument("--csv", help="contacts CSV (default: CSV_FILE_PATH)")
+    parser.add_argument("--dnc", default=DNC_FILE, help=f"Do Not Call list (default: {DNC_FILE})")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("run", help="start the dialer (default)")
+    commands.add_parser("validate", help="check prompts, phone formats, duplicates, consent and DNC")
+    dry = commands.add_parser("dry-run", help="show who would be dialed now and why others are blocked")
+    dry.add_argument("--limit", type=int, help="contacts to list (default: MAX_CONCURRENT_CALLS)")
+    dry.add_argument("--at", help="evaluate at this local time instead of now (YYYY-MM-DDTHH:MM)")
+    commands.add_parser("stats", help="contact counts by status, consent, attempts and prompt")
+    planner = commands.add_parser("plan", help="simulate a dialing day and forecast capacity")
+    planner.add_argument("--profile", help="JSON of measured stage costs in seconds (see capacity.DEFAULT_PROFILE)")
+    planner.add_argument("--cores", type=int, nargs="+", default=[os.cpu_count() or 1], help="core counts to compare")
+    planner.add_argument("--lines", type=int, nargs="+", help="MAX_CONCURRENT_CALLS values to compare (default: configured)")
+    planner.add_argument("--days", type=int, default=1)
+    planner.add_argument("--start-hour", type=float, default=0.0, help="local hour the dialer starts at")
+    planner.add_argument("--seed", type=int, default=0)
+    lead_import = commands.add_parser("import", help="normalize, dedupe and scrub a lead list into the contacts CSV")
+    lead_import.add_argument("source", help="lead list CSV (same columns as the contacts CSV; extra columns are ignored)")
+    lead_import.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    lead_import.add_argument("--chunk-mb", type=int, help="size of each work unit in MB (default: 8)")
+    lead_import.add_argument("--prompt", help="prompt_name for every imported contact (default: from the file)")
+    knowledge = commands.add_parser("index", help="chunk and embed knowledge/<prompt>/ documents for retrieval")
+    knowledge.add_argument("--prompt", help="only this prompt's knowledge (default: all)")
+    knowledge.add_argument("--chunk-words", type=int, help="target words per snippet (default: 60)")
+    knowledge.add_argument("--query", help="search the existing index instead of rebuilding it")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    config = Config()
+    if args.csv:
+        config.csv_file = args.csv
+    if args.command in (None, "run"):
+        return run(config, args.dnc)
+    if args.command == "index":
+        return index_knowledge(config, args)
+    if args.command == "import":
+        return import_file(config, args, normalize_phone_set(load_dnc_list(args.dnc)))
+    table = ContactTable.read_csv(config.csv_file)
+    if args.command == "stats":
+        return stats(config, table)
+    dnc = normalize_phone_set(load_dnc_list(args.dnc))
+    if args.command == "validate":
+        return validate(config, table, dnc)
+    if args.command == "plan":
+        return plan(config, args, table, dnc)
+    timezone = pytz.timezone(config.timezone)
+    now = timezone.localize(datetime.fromisoformat(args.at)) if args.at else datetime.now(timezone)
+    return dry_run(config, table, dnc, now, args.limit or config.max_concurrent_calls)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import io
+import wave
+from functools import lru_cache
+from math import gcd
+from typing import Tuple, Union
+import numpy as np
+
+Buffer = Union[bytes, bytearray, memoryview, np.ndarray]
+
+ULAW_BIAS = 0x84
+ULAW_CLIP = 8159  # 14-bit magnitude limit used by the G.711 encoder
+ULAW_SEGMENT_END = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+
+
+def _build_ulaw_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + ULAW_BIAS) << exponent) - ULAW_BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_ulaw_encode_table() -> np.ndarray:
+    # G.711 reference encoder evaluated for every 16-bit input once; indexed by the sample
+    # reinterpreted as uint16, so encoding a buffer is a single gather.
+    samples = np.arange(65536, dtype=np.int32)
+    samples = np.where(samples >= 32768, samples - 65536, samples) >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), ULAW_CLIP) + (ULAW_BIAS >> 2)
+    segment = np.searchsorted(ULAW_SEGMENT_END, magnitude)
+    code = (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)
+    return (np.where(segment >= 8, 0x7F, code) ^ mask).astype(np.uint8)
+
+
+ULAW_DECODE = _build_ulaw_decode_table()
+ULAW_ENCODE = _build_ulaw_encode_table()
+
+
+def ulaw_decode(data: Buffer) -> np.ndarray:
+    """8-bit mu-law -> int16 PCM."""
+    return ULAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def ulaw_encode(pcm: Buffer) -> bytes:
+    """int16 PCM -> 8-bit mu-law."""
+    samples = pcm if isinstance(pcm, np.ndarray) else np.frombuffer(pcm, dtype=np.int16)
+    return ULAW_ENCODE[samples.astype(np.int16, copy=False).view(np.uint16)].tobytes()
+
+
+def float_to_pcm16(audio: np.ndarray, normalize: bool = True) -> np.ndarray:
+    audio = np.asarray(audio, dtype=np.float32)
+    if normalize and audio.size:
+        audio = audio * (0.99 / max(0.01, float(np.max(np.abs(audio)))))
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def pcm16_to_wav(pcm: Buffer, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def wav_to_pcm16(wav: bytes) -> Tuple[np.ndarray, int]:
+    with wave.open(io.BytesIO(wav), "rb") as wf:
+        rate, channels, width = wf.getframerate(), wf.getnchannels(), wf.getsampwidth()
+        frames = wf.readframes(wf.getnframes())
+    if width != 2:
+        raise ValueError(f"Unsupported WAV sample width: {width * 8} bits")
+    samples = np.frombuffer(frames, dtype=np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+@lru_cache(maxsize=None)
+def _polyphase_filter(up: int, down: int, taps_per_phase: int) -> np.ndarray:
+    length = taps_per_phase * up
+    # An odd number of non-zero taps puts the centre on a sample, so an aligned stream is
+    # delayed by a whole number of samples; an even length gets a trailing zero tap.
+    odd = length - 1 + length % 2
+    cutoff = 0.45 / max(up, down)
+    t = np.arange(odd) - (odd - 1) / 2.0
+    h = 2.0 * cutoff * np.sinc(2.0 * cutoff * t) * np.kaiser(odd, 8.0) * up
+    h = np.concatenate((h, np.zeros(length - odd)))
+    # Row p holds the taps used for output phase p, reversed to line up with an input window.
+    phases = h.reshape(taps_per_phase, up).T[:, ::-1]
+    return np.ascontiguousarray(phases, dtype=np.float32)
+
+
+class Resampler:
+    """
+    Streaming rational (up/down) polyphase resampler. Keeps the filter history and
+    output phase between calls, so a stream can be fed chunk by chunk.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, taps_per_phase: int = 24):
+        divisor = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.taps = taps_per_phase
+        self.phases = _polyphase_filter(self.up, self.down, taps_per_phase)
+        self.reset()
+
+    def reset(self, aligned: bool = False):
+        """`aligned` starts at the filter's centre tap so output sample 0 lines up with input sample 0."""
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._next = (self.taps * self.up - 1) // 2 if aligned else 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        samples = np.asarray(samples, dtype=np.float32)
+        if self.up == self.down:
+            return samples
+        span = samples.size * self.up
+        count = max(0, -(-(span - self._next) // self.down))
+        buffer = np.concatenate((self._history, samples))
+        if count:
+            positions = self._next + self.down * np.arange(count)
+            windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)[positions // self.up]
+            output = np.einsum("ij,ij->i", self.phases[positions % self.up], windows)
+            self._next = int(positions[-1]) + self.down - span
+        else:
+            output = np.zeros(0, dtype=np.float32)
+            self._next -= span
+        self._history = buffer[buffer.size - (self.taps - 1):]
+        return output
+
+
+def resample(samples: np.ndarray, in_rate: int, out_rate: int) -> np.ndarray:
+    """One-shot resampling, time-aligned with the input and trimmed to its duration."""
+    if in_rate == out_rate:
+        return np.asarray(samples, dtype=np.float32)
+    resampler = Resampler(in_rate, out_rate)
+    resampler.reset(aligned=True)
+    padded = np.concatenate((np.asarray(samples, dtype=np.float32), np.zeros(resampler.taps, dtype=np.float32)))
+    return resampler.process(padded)[:int(round(len(samples) * out_rate / in_rate))]
+
+
+def pcm_to_ulaw(samples: np.ndarray, sample_rate: int, target_rate: int = 8000) -> bytes:
+    """Float or int16 audio at any rate -> 8 kHz mu-law for the phone line."""
+    if samples.dtype == np.int16:
+        samples = samples.astype(np.float32) / 32768.0
+    audio = resample(samples, sample_rate, target_rate)
+    return ulaw_encode(float_to_pcm16(audio, normalize=False))
@@ -0,0 +1,48 @@
+import logging
+import re
+from datetime import datetime, time
+from pathlib import Path
+from typing import Optional, Set
+import pytz
+from config import Config
+from models import Contact
+
+DNC_FILE = "dnc_list.txt"
+
+BLOCK_NO_CONSENT = "no_consent"
+BLOCK_OPTED_OUT = "opted_out"
+BLOCK_DNC = "dnc"
+BLOCK_OUTSIDE_HOURS = "outside_hours"
+
+
+def normalize_phone(phone: str) -> str:
+    digits = re.sub(r'\D', '', phone)
+    if len(digits) == 10:
+        digits = '1' + digits
+    return '+' + digits
+
+
+def load_dnc_list(path: str = DNC_FILE) -> Set[str]:
+    dnc_file = Path(path)
+    if not dnc_file.exists():
+        return set()
+    return {normalize_phone(line.strip()) for line in dnc_file.read_text().splitlines() if line.strip()}
+
+
+def within_calling_hours(config: Config, now: Optional[datetime] = None) -> bool:
+    current_time = (now or datetime.now(pytz.timezone(config.timezone))).time()
+    return time(config.calling_hours_start, 0) <= current_time <= time(config.calling_hours_end, 0)
+
+
+def block_reason(contact: Contact, dnc_numbers: Set[str], config: Config, now: Optional[datetime] = None) -> Optional[str]:
+    """Why `contact` may not be dialed right now, or None if it may."""
+    if not contact.consent_obtained:
+        return BLOCK_NO_CONSENT
+    if contact.opt_out_date:
+        return BLOCK_OPTED_OUT
+    if normalize_phone(contact.phone_number) in dnc_numbers:
+        return BLOCK_DNC
+    if not within_calling_hours(config, now):
+        return BLOCK_OUTSIDE_HOURS
+    logging.debug(f"Contact {contact.phone_number} is callable")
+    return None
@@ -15,4 +15,39 @@ class Config:
     calling_hours_start: int = int(os.getenv("CALLING_HOURS_START", "9"))
     calling_hours_end: int = int(os.getenv("CALLING_HOURS_END", "17"))
     timezone: str = os.getenv("TIMEZONE", "US/Eastern")
-    conversation_timeout: int = int(os.getenv("CONVERSATION_TIMEOUT", "120")) 
\ No newline at end of file
+    conversation_timeout: int = int(os.getenv("CONVERSATION_TIMEOUT", "120")) 
+    max_call_duration: int = int(os.getenv("MAX_CALL_DURATION", "600"))
+    server_host: str = os.getenv("SERVER_HOST", "0.0.0.0")
+    server_port: int = int(os.getenv("SERVER_PORT", "8080"))
+    public_base_url: str = os.getenv("PUBLIC_BASE_URL", "https://yourapp.com")
+    vad_threshold_db: float = float(os.getenv("VAD_THRESHOLD_DB", "-45"))
+    vad_min_speech_ms: int = int(os.getenv("VAD_MIN_SPEECH_MS", "100"))
+    vad_hangover_ms: int = int(os.getenv("VAD_HANGOVER_MS", "300"))
+    barge_in_ms: int = int(os.getenv("BARGE_IN_MS", "250"))
+    prompt_reload_interval: float = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
+    draft_model: str = os.getenv("DRAFT_MODEL", "")
+    assisted_prompts: str = os.getenv("ASSISTED_PROMPTS", "")
+    draft_tokens: int = int(os.getenv("DRAFT_TOKENS", "0"))
+    pregenerate_contacts: int = int(os.getenv("PREGENERATE_CONTACTS", "3"))
+    reply_budget_seconds: float = float(os.getenv("REPLY_BUDGET_SECONDS", "20"))
+    reply_budgets: str = os.getenv("REPLY_BUDGETS", "")
+    adaptive_concurrency: bool = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+    min_concurrent_calls: int = int(os.getenv("MIN_CONCURRENT_CALLS", "1"))
+    concurrency_ceiling: int = int(os.getenv("CONCURRENCY_CEILING", "0"))  # 0: 4 x MAX_CONCURRENT_CALLS
+    turn_latency_slo: float = float(os.getenv("TURN_LATENCY_SLO", "3.0"))  # p95 seconds
+    max_model_queue: int = int(os.getenv("MAX_MODEL_QUEUE", "0"))  # 0: 2 x CPU cores
+    log_file: str = os.getenv("LOG_FILE", "calling_system.log")
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_max_bytes: int = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+    log_backups: int = int(os.getenv("LOG_BACKUPS", "5"))
+    log_sampling: str = os.getenv("LOG_SAMPLING", "turn=0.1,stt=0.1,tts=0.1,screening=0.01")
+    knowledge_dir: str = os.getenv("KNOWLEDGE_DIR", "knowledge")
+    knowledge_top_k: int = int(os.getenv("KNOWLEDGE_TOP_K", "3"))
+    knowledge_min_score: float = float(os.getenv("KNOWLEDGE_MIN_SCORE", "0.15"))
+    llm_backend: str = os.getenv("LLM_BACKEND", "local")  # local | remote
+    llm_model: str = os.getenv("LLM_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
+    llm_endpoints: str = os.getenv("LLM_ENDPOINTS", "")  # comma-separated base URLs
+    llm_connect_timeout: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "2"))
+    llm_read_timeout: float = float(os.getenv("LLM_READ_TIMEOUT", "10"))
+    llm_max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    metrics_token: str = os.getenv("METRICS_TOKEN", "")
@@ -0,0 +1,287 @@
+import csv
+import io
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from models import CONTACT_FIELDS, CallStatus
+
+# Same defaults CallSystem.load_contacts applies when a column is missing entirely.
+COLUMN_DEFAULTS = {
+    "status": CallStatus.PENDING.value,
+    "call_attempts": "0",
+    "consent_obtained": "false",
+    "prompt_name": "default",
+}
+
+POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+MAX_PHONE_DIGITS = 15
+KEY_WORDS = 4  # value_counts reads values of up to 32 bytes as integers
+WORD_MASKS = np.array([(1 << (8 * length)) - 1 for length in range(9)], dtype=np.uint64)
+# Odd multipliers (from splitmix64) folding the words of a value into one uint64.
+WORD_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xBF58476D1CE4E5B9, 0x94D049BB133111EB, 0xD6E8FEB86659FD93],
+                            dtype=np.uint64)
+MAX_COMBINATIONS = 1 << 16
+SCAN_BYTES = 1 << 20  # separators are looked for one cache-sized block at a time
+
+
+def _gather(data: np.ndarray, starts: np.ndarray, width: int) -> np.ndarray:
+    """
+    The `width` bytes at each of `starts` as S{width}, zero-padded at the end of the data.
+    `starts` must not decrease, which holds for the fields of a column in row order.
+    """
+    if data.size < width:
+        data = np.concatenate((data, np.zeros(width - data.size, dtype=np.uint8)))
+    # One overlapping item per byte offset, so each row is a single gather rather than
+    # one per byte; the few fields too close to the end of the data come last.
+    last = data.size - width
+    items = np.ndarray((last + 1,), dtype=f"S{width}", buffer=data, strides=(1,))
+    inside = int(np.searchsorted(starts, last, side="right"))
+    gathered = np.empty(starts.size, dtype=f"S{width}")
+    gathered[:inside] = items[starts[:inside]]
+    for row in range(inside, starts.size):
+        gathered[row] = data[starts[row]:].tobytes()
+    return gathered
+
+
+def _fixed_width(data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    lengths = ends - starts
+    width = max(1, int(lengths.max())) if lengths.size else 1
+    column = _gather(data, starts, width)
+    matrix = column.view(np.uint8).reshape(-1, width)
+    matrix *= np.arange(width) < lengths[:, None]
+    return column
+
+
+def _packed(values: List[bytes]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    lengths = np.fromiter((len(value) for value in values), dtype=np.int64, count=len(values))
+    ends = np.cumsum(lengths)
+    return np.frombuffer(b"".join(values) or b"\0", dtype=np.uint8), ends - lengths, ends
+
+
+def normalize_phone_numbers(phones: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized compliance.normalize_phone over a fixed-width bytes array.
+    Returns the normalized numbers as int64 digits (the E.164 number without '+')
+    and a mask of numbers that are plausible E.164 (8-15 digits, no leading zero).
+    Digits are accumulated one byte column at a time (Horner's rule), skipping
+    separators; numbers too long for int64 are invalid and their value is arbitrary.
+    """
+    if phones.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    matrix = phones.view(np.uint8).reshape(phones.size, -1)
+    values = np.zeros(phones.size, dtype=np.int64)
+    count = np.zeros(phones.size, dtype=np.int64)
+    for column in matrix.T:
+        digit = column - np.uint8(48)  # wraps around for bytes below '0'
+        is_digit = digit < 10
+        if is_digit.all():
+            values *= 10
+            values += digit
+            count += 1
+        elif is_digit.any():
+            np.multiply(values, 10, out=values, where=is_digit)
+            np.add(values, digit, out=values, where=is_digit)
+            count += is_digit
+    # A leading zero leaves the value below 10 ** (digits - 1).
+    leading_zero = values < POWERS_OF_TEN[np.clip(count - 1, 0, POWERS_OF_TEN.size - 1)]
+    national = count == 10
+    values[national] += 10 ** 10
+    count[national] = 11
+    valid = (count >= 8) & (count <= MAX_PHONE_DIGITS) & (~leading_zero | national)
+    return values, valid
+
+
+def normalize_phone_set(numbers: Iterable[str]) -> np.ndarray:
+    encoded = [number.encode() for number in numbers]
+    phones = np.array(encoded, dtype=bytes) if encoded else np.zeros(0, dtype="S1")
+    values, _ = normalize_phone_numbers(phones)
+    return np.unique(values)
+
+
+class ContactTable:
+    """
+    Column-oriented, read-only view of the contacts CSV for bulk checks. Columns are kept
+    as byte offsets into the file and only materialized (as fixed-width bytes arrays) when
+    first used, so filters and counts run in NumPy instead of per-row Python. Files without
+    quoted fields are split directly on separator offsets; anything else goes through the
+    csv module.
+    """
+
+    def __init__(self, sources: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]], rows: Optional[np.ndarray] = None):
+        self.sources = sources
+        self.rows = rows
+        first = next(iter(sources.values()), None)
+        self.size = 0 if first is None else (first[1].size if rows is None else rows.size)
+        self._columns: Dict[str, np.ndarray] = {}
+        self._phones: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def read_csv(cls, path: str) -> "ContactTable":
+        """Contacts the dialer would load: rows without a phone number or name are dropped."""
+        csv_file = Path(path)
+        table = cls.from_bytes(csv_file.read_bytes() if csv_file.exists() else b"")
+        return table.where((table.lengths("phone_number") > 0) & (table.lengths("name") > 0))
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "ContactTable":
+        """Every row of CSV text (header included), with defaults for missing columns."""
+        if b"\r" in raw:
+            raw = raw.replace(b"\r\n", b"\n")
+        sources = None if b'"' in raw else cls._split_columns(raw)
+        if sources is None:
+            sources = cls._parse_columns(raw)
+        return cls(cls._with_defaults(sources))
+
+    @staticmethod
+    def _split_columns(raw: bytes) -> Optional[Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+        header_end = raw.find(b"\n")
+        header = raw if header_end < 0 else raw[:header_end]
+        names = [name for name in header.decode().strip().split(",") if name]
+        end = len(raw)
+        while end > header_end + 1 and raw[end - 1] == 10:
+            end -= 1
+        # A blank line (skipped by the csv module) shifts the fields of a multi-column
+        # file off the expected separator pattern below; with one column it cannot be told
+        # from an empty value.
+        if len(names) < 2:
+            return None
+        width = len(names)
+        if header_end < 0 or end <= header_end + 1:
+            empty = np.zeros(0, dtype=np.int64)
+            return {name: (np.zeros(1, dtype=np.uint8), empty, empty) for name in names}
+        data = np.frombuffer(raw, dtype=np.uint8, count=end - header_end - 1, offset=header_end + 1)
+        # Offsets are int32 where they fit: half the memory to write, and to read per column.
+        offset_type = np.int32 if data.size < 2 ** 31 else np.int64
+        is_separator = np.empty(min(SCAN_BYTES, data.size), dtype=bool)
+        is_newline = np.empty_like(is_separator)
+        blocks = []
+        lines = 1
+        for offset in range(0, data.size, SCAN_BYTES):
+            block = data[offset:offset + SCAN_BYTES]
+            separator, newline = is_separator[:block.size], is_newline[:block.size]
+            np.equal(block, 44, out=separator)
+            np.equal(block, 10, out=newline)
+            lines += np.count_nonzero(newline)
+            separator |= newline
+            found = np.flatnonzero(separator).astype(offset_type)
+            found += offset
+            blocks.append(found)
+        bounds = np.empty(sum(found.size for found in blocks) + 2, dtype=offset_type)
+        bounds[0], bounds[-1] = -1, data.size
+        np.concatenate(blocks, out=bounds[1:-1])
+        rows = (bounds.size - 1) // width
+        # With one line per row, the newlines are exactly the separators that close a row.
+        if (bounds.size - 1) % width or lines != rows or not (data[bounds[width:-1:width]] == 10).all():
+            return None
+        starts = (bounds[:-1] + 1).reshape(rows, width)
+        ends = bounds[1:].reshape(rows, width)
+        return {name: (data, starts[:, i], ends[:, i]) for i, name in enumerate(names)}
+
+    @staticmethod
+    def _parse_columns(raw: bytes) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        reader = csv.DictReader(io.StringIO(raw.decode()))
+        values: Dict[str, List[bytes]] = {name: [] for name in reader.fieldnames or []}
+        for row in reader:
+            for name in values:
+                values[name].append((row.get(name) or "").encode())
+        return {name: _packed(column) for name, column in values.items()}
+
+    @staticmethod
+    def _with_defaults(sources: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        size = next(iter(sources.values()))[1].size if sources else 0
+        for name in CONTACT_FIELDS:
+            if name not in sources:
+                sources[name] = _packed([COLUMN_DEFAULTS.get(name, "").encode()] * size)
+        return sources
+
+    def _bounds(self, name: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        data, starts, ends = self.sources[name]
+        if self.rows is not None:
+            starts, ends = starts[self.rows], ends[self.rows]
+        return data, starts, ends
+
+    def lengths(self, name: str) -> np.ndarray:
+        _, starts, ends = self._bounds(name)
+        return ends - starts
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            self._columns[name] = _fixed_width(*self._bounds(name))
+        return self._columns[name]
+
+    def where(self, mask: np.ndarray) -> "ContactTable":
+        if mask.all():
+            return self
+        index = np.flatnonzero(mask)
+        rows = index if self.rows is None else self.rows[index]
+        return ContactTable(self.sources, rows)
+
+    def text(self, name: str, row: int) -> str:
+        data, starts, ends = self._bounds(name)
+        return data[starts[row]:ends[row]].tobytes().decode(errors="replace")
+
+    def _prefixes(self, name: str, width: int) -> np.ndarray:
+        """
+        The first `width` bytes at each field's start as S{width} (running into the next
+        field if shorter, zero-padded at the end of the data).
+        """
+        data, starts, _ = self._bounds(name)
+        return _gather(data, starts, width)
+
+    def equals(self, name: str, value: str) -> np.ndarray:
+        """column(name) == value, reading only len(value) bytes per row instead of materializing the column."""
+        encoded = value.encode()
+        matches = self.lengths(name) == len(encoded)
+        if encoded:
+            matches &= self._prefixes(name, len(encoded)) == encoded
+        return matches
+
+    def consent(self) -> np.ndarray:
+        """consent_obtained.lower() == 'true', without per-row string work."""
+        letters = self._prefixes("consent_obtained", 4).view("<u4") | 0x20202020
+        return (self.lengths("consent_obtained") == 4) & (letters == int.from_bytes(b"true", "little"))
+
+    def phones(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalized numbers (int64) and their validity mask, computed once per table."""
+        if self._phones is None:
+            self._phones = normalize_phone_numbers(self.column("phone_number"))
+        return self._phones
+
+    def value_counts(self, name: str) -> Dict[str, int]:
+        """
+        Counts per distinct value, in value order. Values of up to KEY_WORDS x 8 bytes
+        (status, call_attempts, prompt and timezone names) are read as that many zero-padded
+        uint64 words per row and folded into one integer key, much cheaper to count than
+        strings. The fold is used only if it keeps every combination of the words' distinct
+        values apart; otherwise, and for longer values, the column itself is counted.
+        """
+        lengths = self.lengths(name)
+        words = max(1, -(-int(lengths.max()) // 8)) if lengths.size else 1
+        if words <= KEY_WORDS:
+            prefixes = self._prefixes(name, 8 * words).view("<u8").reshape(-1, words)
+            columns = [prefixes[:, word] & WORD_MASKS[np.clip(lengths - 8 * word, 0, 8)] for word in range(words)]
+            # return_counts keeps np.unique on its sort path, the fast one for few values.
+            distinct = [np.unique(column, return_counts=True)[0] for column in columns]
+            if np.prod([float(values.size) for values in distinct]) <= MAX_COMBINATIONS:
+                combinations = np.stack([grid.ravel() for grid in np.meshgrid(*distinct, indexing="ij")], axis=1)
+                folded = self._fold(list(combinations.T))
+                if np.unique(folded, return_counts=True)[0].size == folded.size:
+                    keys, counts = np.unique(self._fold(columns), return_counts=True)
+                    values = dict(zip(folded.tolist(), combinations.view(f"S{8 * words}").ravel()))
+                    return self._decoded((values[key], count) for key, count in zip(keys.tolist(), counts))
+        values, counts = np.unique(self.column(name), return_counts=True)
+        return self._decoded(zip(values, counts))
+
+    @staticmethod
+    def _fold(columns: List[np.ndarray]) -> np.ndarray:
+        folded = columns[0].copy()
+        for multiplier, column in zip(WORD_MULTIPLIERS[1:], columns[1:]):
+            folded ^= column * multiplier
+        return folded
+
+    @staticmethod
+    def _decoded(counts: Iterable[Tuple[bytes, int]]) -> Dict[str, int]:
+        return dict(sorted((value.rstrip(b"\0").decode(errors="replace"), int(count)) for value, count in counts))
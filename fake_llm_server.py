@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Callable, Optional, Set, Union
+from media_server import HTTP_REASONS, read_http_message
+
+Reply = Union[str, Callable[[str], str]]
+
+
+class FakeLLMServer:
+    """
+    Local stand-in for an inference server, for testing the remote LLM backend without a
+    model. Serves the streaming subset of `POST /v1/completions` (server-sent events over
+    chunked keep-alive responses, like vLLM) plus `GET /health`. Replies are streamed a word
+    at a time, `token_delay` apart; `fail_status` answers every completion with that HTTP
+    error and `stall` accepts requests but never answers, to exercise failover and timeouts.
+    """
+
+    def __init__(self, reply: Reply = "Sure, happy to help.", token_delay: float = 0.0,
+                 fail_status: Optional[int] = None, stall: bool = False, host: str = "127.0.0.1", port: int = 0):
+        self.reply = reply
+        self.token_delay = token_delay
+        self.fail_status = fail_status
+        self.stall = stall
+        self.host = host
+        self.requested_port = port
+        self.connections = 0
+        self.requests = 0
+        self.completed = 0
+        self.aborted = 0
+        self.prompts = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._stopping = asyncio.Event()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.requested_port)
+
+    async def stop(self):
+        self._stopping.set()
+        if self._server:
+            self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        if self._handlers:
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+        if self._server:
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self._server.sockets[0].getsockname()[1]}"
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        self._writers.add(writer)
+        self.connections += 1
+        try:
+            while True:  # keep-alive: serve requests until the client closes the connection
+                request = await read_http_message(reader, max_body=1 << 20)
+                if request is None:
+                    return
+                request_line, _, body = request
+                method, path = (request_line.split(" ") + ["", ""])[:2]
+                if method == "GET" and path == "/health":
+                    await self._respond(writer, 200, b'{"status": "ok"}')
+                elif method == "POST" and path == "/v1/completions":
+                    await self._complete(writer, json.loads(body or b"{}"))
+                else:
+                    await self._respond(writer, 404)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.aborted += 1
+        except Exception as e:
+            logging.error(f"Fake LLM server request failed: {e}")
+        finally:
+            writer.close()
+            self._writers.discard(writer)
+            self._handlers.discard(handler)
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: bytes = b""):
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _complete(self, writer: asyncio.StreamWriter, request: dict):
+        self.requests += 1
+        prompt = request.get("prompt", "")
+        self.prompts.append(prompt)
+        if self.stall:
+            await self._stopping.wait()
+            return
+        if self.fail_status:
+            await self._respond(writer, self.fail_status, b'{"error": "unavailable"}')
+            return
+        reply = self.reply(prompt) if callable(self.reply) else self.reply
+        for stop in request.get("stop") or []:
+            reply = reply.split(stop, 1)[0]
+        words = reply.split(" ")[:request.get("max_tokens", 16)]
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        completion_id = f"cmpl-{uuid.uuid4().hex}"
+        for index, word in enumerate(words):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            finish = ("length" if len(words) < len(reply.split(" ")) else "stop") if index == len(words) - 1 else None
+            event = {"id": completion_id, "object": "text_completion",
+                     "choices": [{"index": 0, "text": (" " if index else "") + word, "finish_reason": finish}]}
+            await self._chunk(writer, f"data: {json.dumps(event)}\n\n".encode())
+        await self._chunk(writer, b"data: [DONE]\n\n")
+        await self._chunk(writer, b"")
+        self.completed += 1
+
+    async def _chunk(self, writer: asyncio.StreamWriter, data: bytes):
+        if writer.is_closing():
+            raise ConnectionResetError("client went away")
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
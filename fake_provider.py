@@ -0,0 +1,183 @@
+import asyncio
+import base64
+import concurrent.futures
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlencode, urlsplit
+from xml.etree import ElementTree
+from config import Config
+from media_server import FRAME_BYTES, SAMPLE_RATE, WebSocket, read_http_message, twilio_signature, websocket_accept
+from models import Contact
+
+ULAW_SILENCE = b"\xff"
+
+
+@dataclass
+class FakeCall:
+    call_sid: str
+    stream_sid: str = ""
+    received: bytearray = field(default_factory=bytearray)
+    marks: List[str] = field(default_factory=list)
+    clears: int = 0
+    closed_by_server: bool = False
+
+
+class FakeProviderClient:
+    """
+    Plays the telephony provider's side of a call against a MediaServer for local testing.
+    Fetches the call-control document, opens the media stream, sends scripted caller audio
+    and collects whatever the server plays back. Requests are signed with `auth_token`
+    (taken from the config passed to initiate_call when not given), as Twilio signs them.
+    """
+
+    def __init__(self, script: Optional[List[bytes]] = None, trailing_silence: float = 3.5,
+                 reply_timeout: float = 30.0, realtime: bool = False, auth_token: str = ""):
+        self.script = script or []
+        self.trailing_silence = trailing_silence
+        self.reply_timeout = reply_timeout
+        self.realtime = realtime
+        self.auth_token = auth_token
+        self.calls: Dict[str, FakeCall] = {}
+        self._tasks: Dict[str, "Union[asyncio.Future, concurrent.futures.Future]"] = {}
+        try:
+            self.loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+
+    def initiate_call(self, contact: Contact, call_id: str, config: Config, twiml_url: str) -> str:
+        """
+        Drop-in replacement for telephony.initiate_call; runs the call in the background on
+        the event loop, whether called on it or, like CallSystem.dial, from a worker thread.
+        """
+        call_sid = f"CA{uuid.uuid4().hex}"
+        self.auth_token = self.auth_token or config.twilio_auth_token
+        try:
+            asyncio.get_running_loop()
+            self._tasks[call_id] = asyncio.ensure_future(self.run_call(twiml_url, call_sid))
+        except RuntimeError:  # a worker thread
+            if self.loop is None:
+                raise RuntimeError("FakeProviderClient must be created on the event loop to dial from threads")
+            self._tasks[call_id] = asyncio.run_coroutine_threadsafe(self.run_call(twiml_url, call_sid), self.loop)
+        logging.info(f"Fake call initiated: {contact.phone_number} -> {call_sid} (Prompt: {contact.prompt_name})")
+        return call_sid
+
+    async def wait(self, call_id: str) -> FakeCall:
+        return await asyncio.wrap_future(self._tasks.pop(call_id))
+
+    async def run_call(self, twiml_url: str, call_sid: Optional[str] = None) -> FakeCall:
+        call = FakeCall(call_sid=call_sid or f"CA{uuid.uuid4().hex}", stream_sid=f"MZ{uuid.uuid4().hex}")
+        self.calls[call.call_sid] = call
+        stream_url = await self._fetch_stream_url(twiml_url, call.call_sid)
+        websocket = await self._connect(stream_url)
+        marks: "asyncio.Queue[str]" = asyncio.Queue()
+        receiver = asyncio.ensure_future(self._receive(websocket, call, marks))
+        hung_up = False
+        try:
+            await self._send(websocket, call, {"event": "connected", "protocol": "Call", "version": "1.0.0"})
+            await self._send(websocket, call, {
+                "event": "start",
+                "start": {
+                    "streamSid": call.stream_sid,
+                    "callSid": call.call_sid,
+                    "tracks": ["inbound"],
+                    "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": SAMPLE_RATE, "channels": 1},
+                },
+            })
+            await self._await_mark(marks, receiver)
+            for utterance in self.script:
+                if receiver.done():
+                    break
+                padding = ULAW_SILENCE * int(self.trailing_silence * SAMPLE_RATE)
+                await self._stream_audio(websocket, call, utterance + padding)
+                await self._await_mark(marks, receiver)
+            if not receiver.done():
+                await self._send(websocket, call, {"event": "stop", "stop": {"callSid": call.call_sid}})
+                await websocket.close()
+                hung_up = True
+        finally:
+            await asyncio.gather(receiver, return_exceptions=True)
+        call.closed_by_server = not hung_up
+        return call
+
+    async def _await_mark(self, marks: "asyncio.Queue[str]", receiver: asyncio.Task):
+        getter = asyncio.ensure_future(marks.get())
+        await asyncio.wait({getter, receiver}, timeout=self.reply_timeout, return_when=asyncio.FIRST_COMPLETED)
+        getter.cancel()
+
+    async def _stream_audio(self, websocket: WebSocket, call: FakeCall, ulaw: bytes):
+        for offset in range(0, len(ulaw), FRAME_BYTES):
+            if websocket.closed:
+                return
+            payload = base64.b64encode(ulaw[offset:offset + FRAME_BYTES]).decode()
+            await self._send(websocket, call, {"event": "media", "media": {"track": "inbound", "payload": payload}})
+            if self.realtime:
+                await asyncio.sleep(FRAME_BYTES / SAMPLE_RATE)
+
+    async def _send(self, websocket: WebSocket, call: FakeCall, event: Dict):
+        event.setdefault("streamSid", call.stream_sid)
+        await websocket.send_text(json.dumps(event))
+
+    async def _receive(self, websocket: WebSocket, call: FakeCall, marks: "asyncio.Queue[str]"):
+        while True:
+            message = await websocket.recv()
+            if message is None:
+                return
+            event = json.loads(message)
+            if event.get("event") == "media":
+                call.received.extend(base64.b64decode(event["media"]["payload"]))
+            elif event.get("event") == "mark":
+                name = event["mark"]["name"]
+                call.marks.append(name)
+                await self._send(websocket, call, {"event": "mark", "mark": {"name": name}})
+                marks.put_nowait(name)
+            elif event.get("event") == "clear":
+                call.clears += 1
+
+    def _signature(self, url: str, params: Optional[List[Tuple[str, str]]] = None) -> str:
+        if not self.auth_token:
+            return ""
+        return f"X-Twilio-Signature: {twilio_signature(self.auth_token, url, params)}\r\n"
+
+    async def _open(self, url: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, str, str]:
+        parts = urlsplit(url)
+        secure = parts.scheme in ("https", "wss")
+        port = parts.port or (443 if secure else 80)
+        reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=True if secure else None)
+        return reader, writer, parts.netloc, parts.path or "/"
+
+    async def _fetch_stream_url(self, twiml_url: str, call_sid: str) -> str:
+        reader, writer, host, path = await self._open(twiml_url)
+        params = {"CallSid": call_sid, "CallStatus": "in-progress"}
+        body = urlencode(params).encode()
+        writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/x-www-form-urlencoded\r\n"
+            f"{self._signature(twiml_url, list(params.items()))}"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        response = await read_http_message(reader)
+        writer.close()
+        if response is None or response[0].split(" ")[1:2] != ["200"]:
+            raise ConnectionError(f"Call-control request to {twiml_url} failed")
+        stream = ElementTree.fromstring(response[2]).find("./Connect/Stream")
+        if stream is None:
+            raise ValueError(f"No media stream in call-control document from {twiml_url}")
+        return stream.attrib["url"]
+
+    async def _connect(self, stream_url: str) -> WebSocket:
+        reader, writer, host, path = await self._open(stream_url)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n{self._signature(stream_url)}\r\n".encode()
+        )
+        await writer.drain()
+        response = await read_http_message(reader)
+        if response is None or response[1].get("sec-websocket-accept") != websocket_accept(key):
+            writer.close()
+            raise ConnectionError(f"Media stream handshake with {stream_url} failed")
+        return WebSocket(reader, writer, mask_outgoing=True)
@@ -0,0 +1,218 @@
+import json
+import logging
+import math
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+# Source documents live in knowledge/<prompt_name>/*.txt|*.md; `main.py index` writes the
+# index of each prompt to knowledge/.index/<prompt_name>.{npy,idf.npy,json}. The unit-length
+# vectors are stored as int16 fixed point (half the size of float32, and unlike float16 fast
+# to widen) and transposed (feature x chunk): a query only has a few dozen non-zero
+# features, and each of them is then one contiguous row to read.
+INDEX_DIR = ".index"
+SOURCE_SUFFIXES = (".txt", ".md")
+DIMENSIONS = 1024  # hashed feature space, a power of two
+SCALE = 32767
+CHUNK_WORDS = 60
+TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+SENTENCE = re.compile(r"(?<=[.!?])\s+")
+SUFFIXES = ("ations", "ation", "ities", "ity", "ings", "ing", "ers", "er", "ed", "es", "ly", "s", "e")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can could do does for from had has have how i if in is it its "
+    "me my of on or our so that the their them then there these they this to was we were what "
+    "when where which who why will with would you your yes no ok okay um uh".split()
+)
+
+
+@dataclass(frozen=True)
+class Snippet:
+    text: str
+    source: str
+    score: float
+
+
+def chunk_document(text: str, words: int = CHUNK_WORDS) -> Iterator[str]:
+    """
+    Paragraphs packed into chunks of about `words` words on sentence boundaries. Markdown
+    headings are not chunks of their own; they prefix the chunks under them.
+    """
+    heading = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        lines = [line.strip() for line in paragraph.strip().splitlines()]
+        while lines and lines[0].startswith("#"):
+            heading = lines.pop(0).lstrip("#").strip()
+        if not lines:
+            continue
+        current: List[str] = []
+        for sentence in SENTENCE.split(" ".join(lines)):
+            if current and len(" ".join(current + [sentence]).split()) > words:
+                yield _titled(heading, current)
+                current = []
+            current.append(sentence)
+        if current:
+            yield _titled(heading, current)
+
+
+def _titled(heading: str, sentences: List[str]) -> str:
+    body = " ".join(sentences)
+    return f"{heading}: {body}" if heading else body
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping, enough for "secure"/"security" or "cancel"/"cancelled" to meet."""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    return word[:-1] if len(word) > 3 and word[-1] == word[-2] else word
+
+
+def _features(text: str) -> Counter:
+    """Hashed unigram and bigram counts of the content words; the sign bit halves collision bias."""
+    words = [_stem(word) for word in TOKEN.findall(text.lower()) if word not in STOPWORDS]
+    counts: Counter = Counter()
+    for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(term.encode())
+        counts[(h & (DIMENSIONS - 1), 1.0 if h & 0x80000000 else -1.0)] += 1
+    return counts
+
+
+def embed(text: str, idf: np.ndarray) -> np.ndarray:
+    """Unit-length sublinear TF-IDF vector of `text` in the hashed feature space."""
+    return _vector(_features(text), idf)
+
+
+def _vector(counts: Counter, idf: np.ndarray) -> np.ndarray:
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for (dim, sign), count in counts.items():
+        vector[dim] += sign * (1.0 + math.log(count))
+    vector *= idf
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def index_paths(knowledge_dir: str, prompt_name: str) -> Tuple[Path, Path, Path]:
+    base = Path(knowledge_dir) / INDEX_DIR / prompt_name
+    return base.with_suffix(".npy"), base.with_suffix(".idf.npy"), base.with_suffix(".json")
+
+
+def build_index(knowledge_dir: str, prompt_name: str, words: int = CHUNK_WORDS) -> Tuple[int, int]:
+    """Chunk and embed knowledge/<prompt_name>/; returns (files, chunks)."""
+    source_dir = Path(knowledge_dir) / prompt_name
+    if not source_dir.is_dir():
+        raise FileNotFoundError(f"no knowledge directory {source_dir}")
+    files = sorted(path for path in source_dir.rglob("*") if path.suffix in SOURCE_SUFFIXES and path.is_file())
+    chunks = [{"text": chunk, "source": str(path.relative_to(source_dir))}
+              for path in files for chunk in chunk_document(path.read_text(), words)]
+
+    document_frequency = np.zeros(DIMENSIONS, dtype=np.float32)
+    features = [_features(chunk["text"]) for chunk in chunks]
+    for counts in features:
+        document_frequency[list({dim for dim, _ in counts})] += 1
+    idf = (np.log((1 + len(chunks)) / (1 + document_frequency)) + 1).astype(np.float32)
+    vectors = np.stack([_vector(counts, idf) for counts in features], axis=1) if chunks else \
+        np.zeros((DIMENSIONS, 0), dtype=np.float32)
+
+    vectors_path, idf_path, chunks_path = index_paths(knowledge_dir, prompt_name)
+    vectors_path.parent.mkdir(parents=True, exist_ok=True)
+    # The chunk list goes last: its mtime is what running dialers watch for a rebuilt index.
+    for path, write in ((vectors_path, lambda f: np.save(f, np.round(vectors * SCALE).astype(np.int16))), (idf_path, lambda f: np.save(f, idf)),
+                        (chunks_path, lambda f: f.write(json.dumps(chunks).encode()))):
+        partial = path.with_name(path.name + ".tmp")
+        with open(partial, "wb") as f:
+            write(f)
+        os.replace(partial, path)
+    return len(files), len(chunks)
+
+
+def knowledge_prompts(knowledge_dir: str) -> List[str]:
+    root = Path(knowledge_dir)
+    return sorted(path.name for path in root.iterdir() if path.is_dir() and path.name != INDEX_DIR) \
+        if root.is_dir() else []
+
+
+class KnowledgeIndex:
+    """One prompt's chunk vectors, memory-mapped read-only so dialer processes share the pages."""
+
+    def __init__(self, knowledge_dir: str, prompt_name: str):
+        vectors_path, idf_path, chunks_path = index_paths(knowledge_dir, prompt_name)
+        self.chunks = json.loads(chunks_path.read_text())
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        self.idf = np.load(idf_path)
+        if self.vectors.shape != (DIMENSIONS, len(self.chunks)) or self.vectors.dtype != np.int16:
+            raise ValueError(f"index for {prompt_name} is incomplete or outdated; rebuild it")
+
+    def search(self, query: str, k: int, min_score: float = 0.0) -> List[Snippet]:
+        if not len(self.chunks):
+            return []
+        query_vector = embed(query, self.idf)
+        features = np.flatnonzero(query_vector)
+        if not len(features):
+            return []
+        scores = (query_vector[features] / SCALE) @ self.vectors[features].astype(np.float32)
+        k = min(k, len(scores))
+        top = np.argpartition(scores, len(scores) - k)[-k:]
+        top = top[np.argsort(-scores[top])]
+        return [Snippet(self.chunks[i]["text"], self.chunks[i]["source"], float(scores[i]))
+                for i in top if scores[i] > min_score]
+
+
+class KnowledgeBase:
+    """
+    Per-prompt retrieval for generate_response. Indexes are loaded on first use and
+    reloaded when `main.py index` rewrites them (checked at most every `reload_interval`
+    seconds); prompts without a knowledge directory simply get no snippets.
+    """
+
+    def __init__(self, knowledge_dir: str, top_k: int = 3, min_score: float = 0.15, reload_interval: float = 2.0):
+        self.knowledge_dir = knowledge_dir
+        self.top_k = top_k
+        self.min_score = min_score
+        self.reload_interval = reload_interval
+        self._indexes: Dict[str, Tuple[Optional[KnowledgeIndex], Optional[int], float]] = {}
+        self.lookups = 0
+        self.injected = 0
+        self.seconds = 0.0
+
+    def _index(self, prompt_name: str) -> Optional[KnowledgeIndex]:
+        index, signature, checked = self._indexes.get(prompt_name, (None, None, -math.inf))
+        now = time.monotonic()
+        if now - checked < self.reload_interval:
+            return index
+        try:
+            current = index_paths(self.knowledge_dir, prompt_name)[2].stat().st_mtime_ns
+        except OSError:
+            current = None
+        if current != signature:
+            try:
+                index = KnowledgeIndex(self.knowledge_dir, prompt_name) if current is not None else None
+                if index:
+                    logging.info(f"Loaded knowledge index for {prompt_name}: {len(index.chunks)} chunks")
+            except (OSError, ValueError) as e:
+                logging.error(f"Knowledge index for {prompt_name} not loaded: {e}")
+                index = None
+        self._indexes[prompt_name] = (index, current, now)
+        return index
+
+    def search(self, prompt_name: str, query: str) -> List[Snippet]:
+        index = self._index(prompt_name)
+        started = time.perf_counter()
+        snippets = index.search(query, self.top_k, self.min_score) if index and query.strip() else []
+        self.lookups += 1
+        self.injected += bool(snippets)
+        self.seconds += time.perf_counter() - started
+        return snippets
+
+    def metrics(self) -> Dict:
+        return {
+            "lookups": self.lookups,
+            "injected": self.injected,
+            "avg_ms": round(1000 * self.seconds / self.lookups, 3) if self.lookups else None,
+        }
@@ -0,0 +1,210 @@
+import csv
+import io
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+import numpy as np
+from compliance import BLOCK_DNC, BLOCK_NO_CONSENT, BLOCK_OPTED_OUT
+from contact_table import ContactTable
+from models import CONTACT_FIELDS, CallStatus
+
+CHUNK_BYTES = 8 * 1024 * 1024
+
+REJECT_MISSING_FIELDS = "missing_fields"
+REJECT_INVALID_PHONE = "invalid_phone"
+REJECT_DUPLICATE = "duplicate"
+
+# Index = reason code returned by scrub_chunk; 0 means the row is accepted.
+REASONS = [None, REJECT_MISSING_FIELDS, REJECT_INVALID_PHONE, BLOCK_NO_CONSENT, BLOCK_OPTED_OUT, BLOCK_DNC, REJECT_DUPLICATE]
+DUPLICATE = REASONS.index(REJECT_DUPLICATE)
+
+_dnc = np.zeros(0, dtype=np.int64)
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    accepted: int = 0
+    rejected: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def read_chunks(path: str, chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    The file as header-prefixed blocks of whole rows, each parseable on its own. A block
+    never ends inside a quoted field, so quoted values may contain newlines.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        if not header.endswith(b"\n"):
+            header += b"\n"
+        carry = b""
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            block = carry + block
+            cut = block.rfind(b"\n") + 1
+            while cut and block.count(b'"', 0, cut) % 2:
+                cut = block.rfind(b"\n", 0, cut - 1) + 1
+            if cut:
+                yield header + block[:cut]
+            carry = block[cut:]
+        if carry.strip():
+            yield header + carry
+
+
+def _init_worker(dnc: np.ndarray):
+    global _dnc
+    _dnc = dnc
+
+
+def _render(table: ContactTable, numbers: np.ndarray, rows: np.ndarray, prompt_name: Optional[str],
+            quoted: bool) -> Tuple[bytes, np.ndarray]:
+    columns = {name: repeat(b"") for name in CONTACT_FIELDS}
+    columns.update(
+        phone_number=[b"+%d" % number for number in numbers[rows].tolist()],
+        status=repeat(CallStatus.PENDING.value.encode()),
+        call_attempts=repeat(b"0"),
+        consent_obtained=repeat(b"True"),
+    )
+    for name in ("name", "email", "company"):
+        columns[name] = table.column(name)[rows].tolist()
+    if prompt_name:
+        columns["prompt_name"] = repeat(prompt_name.encode())
+    else:
+        columns["prompt_name"] = [value or b"default" for value in table.column("prompt_name")[rows].tolist()]
+    lines = zip(*(columns[name] for name in CONTACT_FIELDS))  # phone_number bounds the repeats
+    if quoted:
+        # Values may contain separators; let the csv module quote them.
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        rendered = []
+        for line in lines:
+            writer.writerow([value.decode(errors="replace") for value in line])
+            rendered.append(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        # Split on separators in the first place, so no value needs quoting.
+        rendered = [b",".join(line) + b"\r\n" for line in lines]
+    offsets = np.zeros(len(rendered) + 1, dtype=np.int64)
+    np.cumsum([len(line) for line in rendered], out=offsets[1:])
+    return b"".join(rendered), offsets
+
+
+def scrub_chunk(chunk: bytes, prompt_name: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, bytes, np.ndarray]:
+    """
+    Normalize and scrub one block of leads. Returns the normalized numbers, a reason code
+    per row (see REASONS) and the accepted rows rendered as contacts CSV, with the offset
+    where each accepted row starts so the caller can still drop duplicates.
+    """
+    table = ContactTable.from_bytes(chunk)
+    numbers, valid = table.phones()
+    checks = [
+        (table.lengths("phone_number") == 0) | (table.lengths("name") == 0),
+        ~valid,
+        ~table.consent(),
+        table.lengths("opt_out_date") > 0,
+        np.isin(numbers, _dnc),
+    ]
+    reasons = np.zeros(len(table), dtype=np.int8)
+    for code, failed in enumerate(checks, 1):
+        reasons[(reasons == 0) & failed] = code
+    text, offsets = _render(table, numbers, np.flatnonzero(reasons == 0), prompt_name, b'"' in chunk)
+    return numbers, reasons, text, offsets
+
+
+class _Deduplicator:
+    """First occurrence wins, across chunks and against numbers already in the contacts file."""
+
+    def __init__(self, existing: np.ndarray):
+        self.seen = np.unique(existing)
+
+    def duplicates(self, numbers: np.ndarray) -> np.ndarray:
+        duplicate = np.ones(numbers.size, dtype=bool)
+        duplicate[np.unique(numbers, return_index=True)[1]] = False
+        if self.seen.size:
+            position = np.minimum(np.searchsorted(self.seen, numbers), self.seen.size - 1)
+            duplicate |= self.seen[position] == numbers
+        # Both halves are sorted runs, which the stable sort merges in linear time.
+        self.seen = np.sort(np.concatenate((self.seen, np.sort(numbers[~duplicate]))), kind="stable")
+        return duplicate
+
+
+def _open_destination(path: Path):
+    header = ",".join(CONTACT_FIELDS)
+    if path.exists() and path.stat().st_size:
+        with open(path, "rb") as f:
+            existing_header = f.readline().decode().strip()
+            f.seek(-1, os.SEEK_END)
+            ends_with_newline = f.read(1) == b"\n"
+        if existing_header != header:
+            raise ValueError(f"{path} has columns {existing_header!r}, expected {header!r}")
+        out = open(path, "ab")
+        if not ends_with_newline:
+            out.write(b"\r\n")
+        return out
+    out = open(path, "wb")
+    out.write(header.encode() + b"\r\n")
+    return out
+
+
+def import_leads(source: str, destination: str, dnc: np.ndarray, workers: Optional[int] = None,
+                 chunk_bytes: int = CHUNK_BYTES, prompt_name: Optional[str] = None) -> ImportReport:
+    """
+    Append the dialable rows of `source` to the contacts CSV at `destination`, with phone
+    numbers in E.164 form and status pending. Chunks are parsed and scrubbed in a process
+    pool (at most two in flight per worker, so memory stays bounded); deduplication and
+    writing happen here, in file order.
+    """
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    numbers, valid = ContactTable.read_csv(destination).phones()
+    deduplicator = _Deduplicator(numbers[valid])
+    counts = np.zeros(len(REASONS), dtype=np.int64)
+
+    with _open_destination(Path(destination)) as out:
+        def consume(result):
+            numbers, reasons, text, offsets = result
+            candidates = np.flatnonzero(reasons == 0)
+            duplicate = deduplicator.duplicates(numbers[candidates])
+            reasons[candidates[duplicate]] = DUPLICATE
+            if duplicate.any():
+                text = b"".join(text[offsets[i]:offsets[i + 1]] for i in np.flatnonzero(~duplicate).tolist())
+            out.write(text)
+            counts[:] += np.bincount(reasons, minlength=len(REASONS))
+
+        if workers == 1:
+            _init_worker(dnc)
+            for chunk in read_chunks(source, chunk_bytes):
+                consume(scrub_chunk(chunk, prompt_name))
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(dnc,)) as pool:
+                pending = deque()
+                for chunk in read_chunks(source, chunk_bytes):
+                    pending.append(pool.submit(scrub_chunk, chunk, prompt_name))
+                    if len(pending) >= 2 * workers:
+                        consume(pending.popleft().result())
+                while pending:
+                    consume(pending.popleft().result())
+
+    report = ImportReport(
+        rows=int(counts.sum()),
+        accepted=int(counts[0]),
+        rejected={reason: int(count) for reason, count in zip(REASONS[1:], counts[1:])},
+        seconds=time.perf_counter() - started,
+    )
+    logging.info(f"Imported {report.accepted}/{report.rows} leads from {source} "
+                 f"in {report.seconds:.2f}s ({report.rows_per_second:,.0f} rows/s)")
+    return report
@@ -1,6 +1,5 @@
-import asyncio
-from call_system import CallSystem
+import sys
+from cli import main
 
 if __name__ == "__main__":
-    system = CallSystem()
-    asyncio.run(system.run()) 
\ No newline at end of file
+    sys.exit(main())
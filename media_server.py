@@ -0,0 +1,544 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qsl, unquote, urlsplit
+from xml.sax.saxutils import quoteattr
+from cancellation import Cancelled
+from codec import pcm_to_ulaw, ulaw_decode
+from config import Config
+from vad import SPEECH_END, VoiceActivityDetector
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+SAMPLE_RATE = 8000
+FRAME_BYTES = 160  # 20 ms of 8 kHz mu-law
+PREROLL_MS = 300
+MAX_BODY_BYTES = 64 * 1024  # call-control webhooks are form posts of a few hundred bytes
+MAX_MESSAGE_BYTES = 64 * 1024  # media messages carry 20 ms of audio
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+HTTP_REASONS = {101: "Switching Protocols", 200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+                405: "Method Not Allowed"}
+
+
+def _apply_mask(data: bytes, mask: bytes) -> bytes:
+    if not data:
+        return data
+    key = (mask * (len(data) // 4 + 1))[:len(data)]
+    return (int.from_bytes(data, "little") ^ int.from_bytes(key, "little")).to_bytes(len(data), "little")
+
+
+def websocket_accept(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def twilio_signature(auth_token: str, url: str, params: Optional[List[Tuple[str, str]]] = None) -> str:
+    """X-Twilio-Signature of a request: HMAC-SHA1 of the URL followed by the sorted POST parameters."""
+    payload = url + "".join(name + value for name, value in sorted(params or []))
+    return base64.b64encode(hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()).decode()
+
+
+class MessageTooBig(Exception):
+    pass
+
+
+class WebSocket:
+    """Minimal RFC 6455 endpoint over asyncio streams (text/binary messages, ping/pong, close)."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, mask_outgoing: bool = False,
+                 max_message: int = MAX_MESSAGE_BYTES):
+        self.reader = reader
+        self.writer = writer
+        self.mask_outgoing = mask_outgoing
+        self.max_message = max_message
+        self.closed = False
+
+    async def recv(self) -> Optional[Union[str, bytes]]:
+        message = bytearray()
+        message_opcode = None
+        while True:
+            try:
+                fin, opcode, payload = await self._read_frame(self.max_message - len(message))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                return None
+            except MessageTooBig:
+                await self.close(1009)
+                return None
+            if opcode == OP_PING:
+                await self._send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    await self._send_frame(OP_CLOSE, payload[:2])
+                return None
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+            message.extend(payload)
+            if fin:
+                return message.decode() if message_opcode == OP_TEXT else bytes(message)
+
+    async def send_text(self, text: str):
+        await self._send_frame(OP_TEXT, text.encode())
+
+    async def send_bytes(self, data: bytes):
+        await self._send_frame(OP_BINARY, data)
+
+    async def close(self, code: int = 1000):
+        if not self.closed:
+            self.closed = True
+            await self._send_frame(OP_CLOSE, code.to_bytes(2, "big"))
+        self.writer.close()
+
+    async def _read_frame(self, limit: int) -> Tuple[bool, int, bytes]:
+        head = await self.reader.readexactly(2)
+        fin = bool(head[0] & 0x80)
+        opcode = head[0] & 0x0F
+        masked = bool(head[1] & 0x80)
+        length = head[1] & 0x7F
+        if length == 126:
+            length = int.from_bytes(await self.reader.readexactly(2), "big")
+        elif length == 127:
+            length = int.from_bytes(await self.reader.readexactly(8), "big")
+        if length > (125 if opcode & 0x8 else limit):
+            raise MessageTooBig(length)
+        mask = await self.reader.readexactly(4) if masked else b""
+        payload = await self.reader.readexactly(length)
+        return fin, opcode, _apply_mask(payload, mask) if masked else payload
+
+    async def _send_frame(self, opcode: int, payload: bytes):
+        if self.writer.is_closing():
+            return
+        length = len(payload)
+        mask_bit = 0x80 if self.mask_outgoing else 0
+        if length < 126:
+            header = bytes([0x80 | opcode, mask_bit | length])
+        elif length < 1 << 16:
+            header = bytes([0x80 | opcode, mask_bit | 126]) + length.to_bytes(2, "big")
+        else:
+            header = bytes([0x80 | opcode, mask_bit | 127]) + length.to_bytes(8, "big")
+        if self.mask_outgoing:
+            mask = os.urandom(4)
+            header += mask
+            payload = _apply_mask(payload, mask)
+        try:
+            self.writer.write(header + payload)
+            await self.writer.drain()
+        except ConnectionError:
+            self.closed = True
+
+
+async def read_http_message(reader: asyncio.StreamReader,
+                            max_body: int = MAX_BODY_BYTES) -> Optional[Tuple[str, Dict[str, str], bytes]]:
+    """Request/status line, lower-cased headers and body; None on EOF or a malformed or oversized message."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        return None
+    if not 0 <= length <= max_body:
+        return None
+    body = await reader.readexactly(length) if length else b""
+    return lines[0], headers, body
+
+
+class CallSession:
+    def __init__(self, call_id: str, websocket: WebSocket, vad: VoiceActivityDetector):
+        self.call_id = call_id
+        self.websocket = websocket
+        self.vad = vad
+        self.stream_sid = ""
+        self.inbound = bytearray()
+        self.utterances: "asyncio.Queue[Tuple[bytes, float]]" = asyncio.Queue()  # audio, loop time speech ended
+        self.playing = False
+        self.interrupted = False
+        self.tasks: Set[asyncio.Task] = set()
+        self.turn: Optional[asyncio.Task] = None
+        self.carried = b""  # audio of an abandoned turn that never reached the conversation
+        self.marks: Dict[str, asyncio.Event] = {}
+        self._mark_seq = 0
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() and not isinstance(task.exception(), Cancelled):
+            logging.error("Media task failed for call_id=%s: %s", self.call_id, task.exception(), extra={"call_id": self.call_id})
+
+    async def send_event(self, event: Dict):
+        event.setdefault("streamSid", self.stream_sid)
+        await self.websocket.send_text(json.dumps(event))
+
+    async def play(self, ulaw: bytes, wait: bool = True):
+        if not ulaw or self.websocket.closed:
+            return
+        self.playing = True
+        self.interrupted = False
+        self._mark_seq += 1
+        name = f"{self.call_id}-{self._mark_seq}"
+        played = self.marks[name] = asyncio.Event()
+        try:
+            for offset in range(0, len(ulaw), FRAME_BYTES):
+                if self.interrupted:
+                    return
+                payload = base64.b64encode(ulaw[offset:offset + FRAME_BYTES]).decode()
+                await self.send_event({"event": "media", "media": {"payload": payload}})
+            await self.send_event({"event": "mark", "mark": {"name": name}})
+            if wait:
+                await asyncio.wait_for(played.wait(), timeout=len(ulaw) / SAMPLE_RATE + 2.0)
+        except asyncio.TimeoutError:
+            logging.debug("Playback mark %s not acknowledged for call_id=%s", name, self.call_id, extra={"call_id": self.call_id})
+        finally:
+            self.marks.pop(name, None)
+            self.playing = False
+
+    def interrupt(self):
+        """Barge-in: drop audio queued at the provider and release the pending playback."""
+        if not self.playing or self.interrupted:
+            return
+        self.interrupted = True
+        logging.info("Barge-in on call_id=%s, stopping playback", self.call_id, extra={"call_id": self.call_id})
+        self.spawn(self.send_event({"event": "clear"}))
+        for played in self.marks.values():
+            played.set()
+
+    @property
+    def thinking(self) -> bool:
+        """A reply is being transcribed, generated or synthesized but has not started playing."""
+        return self.turn is not None and not self.turn.done() and not self.playing
+
+    def cancel_turn(self):
+        """The caller spoke again before hearing the reply: abandon it and free its model jobs."""
+        if not self.thinking:
+            return
+        logging.info("Caller spoke again on call_id=%s, abandoning the pending reply", self.call_id, extra={"call_id": self.call_id})
+        self.turn.cancel()
+
+    def on_mark(self, name: str):
+        played = self.marks.get(name)
+        if played:
+            played.set()
+
+    async def hangup(self):
+        await self.websocket.close()
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class MediaServer:
+    """Serves call-control documents and bidirectional media streams for in-flight calls."""
+
+    def __init__(self, ai_manager, config: Config):
+        self.ai_manager = ai_manager
+        self.config = config
+        self.sessions: Dict[str, CallSession] = {}
+        self.call_events: Dict[str, asyncio.Event] = {}
+        self.answered: Dict[str, asyncio.Event] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+        self.latency_listeners: List[Callable[[float], None]] = []
+        self.metrics_sources: Dict[str, Callable[[], Dict]] = {}
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_client, self.config.server_host, self.config.server_port, backlog=1024
+        )
+        logging.info(f"Media server listening on {self.config.server_host}:{self.port}")
+
+    async def stop(self):
+        for session in list(self.sessions.values()):
+            await session.hangup()
+        if self._handlers:
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        logging.info("Media server stopped.")
+
+    @property
+    def port(self) -> int:
+        if not self._server or not self._server.sockets:
+            return self.config.server_port
+        return self._server.sockets[0].getsockname()[1]
+
+    def twiml_url(self, call_id: str) -> str:
+        return f"{self.config.public_base_url.rstrip('/')}/twiml/{call_id}"
+
+    def stream_url(self, call_id: str) -> str:
+        base = self.config.public_base_url.rstrip("/")
+        if base.startswith("https://"):
+            base = "wss://" + base[len("https://"):]
+        elif base.startswith("http://"):
+            base = "ws://" + base[len("http://"):]
+        return f"{base}/media/{call_id}"
+
+    def twiml(self, call_id: str) -> str:
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f"<Response><Connect><Stream url={quoteattr(self.stream_url(call_id))} /></Connect></Response>"
+        )
+
+    def expect_call(self, call_id: str):
+        self.call_events[call_id] = asyncio.Event()
+        self.answered[call_id] = asyncio.Event()
+
+    def forget_call(self, call_id: str):
+        self.call_events.pop(call_id, None)
+        self.answered.pop(call_id, None)
+
+    async def wait_for_answer(self, call_id: str, timeout: float) -> bool:
+        """
+        Whether the callee picked up within `timeout`: the provider fetches the call-control
+        document (or opens the stream) only once the call is answered. An unanswered call
+        is forgotten.
+        """
+        answered = self.answered.setdefault(call_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(answered.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logging.info("Call %s not answered within %ss", call_id, timeout, extra={"call_id": call_id})
+            self.forget_call(call_id)
+            return False
+
+    async def wait_for_call(self, call_id: str, timeout: float) -> bool:
+        done = self.call_events.setdefault(call_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(done.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logging.warning("Call %s still streaming after %ss, hanging up", call_id, timeout, extra={"call_id": call_id})
+            session = self.sessions.get(call_id)
+            if session:
+                await session.hangup()
+            return False
+        finally:
+            self.forget_call(call_id)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            request = await read_http_message(reader)
+            if request is None:
+                return
+            request_line, headers, body = request
+            parts = request_line.split(" ")
+            if len(parts) != 3:
+                await self._respond(writer, 400)
+                return
+            method, target = parts[0], unquote(urlsplit(parts[1]).path)
+            route, _, call_id = target.strip("/").partition("/")
+            if route in ("twiml", "media") and call_id not in self.call_events:
+                # Only calls this dialer placed and is waiting on get a document or a stream.
+                await self._respond(writer, 404)
+            elif route == "twiml":
+                if method not in ("GET", "POST"):
+                    await self._respond(writer, 405)
+                    return
+                form = parse_qsl(body.decode("latin-1"), keep_blank_values=True) \
+                    if headers.get("content-type", "").startswith("application/x-www-form-urlencoded") else []
+                if not self._signed(headers, [self._public_url(parts[1])], form):
+                    await self._respond(writer, 403)
+                    return
+                self._on_answer(call_id)
+                await self._respond(writer, 200, self.twiml(call_id).encode(), "text/xml")
+            elif route == "media" and headers.get("upgrade", "").lower() == "websocket":
+                key = headers.get("sec-websocket-key")
+                if not key:
+                    await self._respond(writer, 400)
+                    return
+                if call_id in self.sessions or not self._signed(headers, [self.stream_url(call_id), self._public_url(parts[1])]):
+                    await self._respond(writer, 403)
+                    return
+                writer.write(
+                    "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                    f"Sec-WebSocket-Accept: {websocket_accept(key)}\r\n\r\n".encode()
+                )
+                await writer.drain()
+                await self._run_stream(call_id, WebSocket(reader, writer))
+            elif route == "health":
+                body = json.dumps({"active_calls": len(self.sessions)}).encode()
+                await self._respond(writer, 200, body, "application/json")
+            elif route == "metrics":
+                if not self._may_read_metrics(headers, writer):
+                    await self._respond(writer, 403)
+                    return
+                metrics = self.ai_manager.metrics() if hasattr(self.ai_manager, "metrics") else {}
+                metrics.update({name: source() for name, source in self.metrics_sources.items()})
+                await self._respond(writer, 200, json.dumps(metrics).encode(), "application/json")
+            else:
+                await self._respond(writer, 404)
+        except Exception as e:
+            logging.error(f"Media server request failed: {e}")
+        finally:
+            writer.close()
+            self._handlers.discard(handler)
+
+    def _public_url(self, target: str) -> str:
+        """The URL the provider requested, as it was put to it (before any proxy)."""
+        return self.config.public_base_url.rstrip("/") + target
+
+    def _signed(self, headers: Dict[str, str], urls: List[str], params: Optional[List[Tuple[str, str]]] = None) -> bool:
+        """Whether the request carries the provider's signature; unchecked without TWILIO_AUTH_TOKEN."""
+        token = self.config.twilio_auth_token
+        if not token:
+            return True
+        signature = headers.get("x-twilio-signature", "")
+        return any(hmac.compare_digest(signature, twilio_signature(token, url, params)) for url in urls)
+
+    def _may_read_metrics(self, headers: Dict[str, str], writer: asyncio.StreamWriter) -> bool:
+        """Metrics are served to local clients, or to others presenting METRICS_TOKEN."""
+        token = self.config.metrics_token
+        if token and hmac.compare_digest(headers.get("authorization", ""), f"Bearer {token}"):
+            return True
+        peer = writer.get_extra_info("peername")
+        try:
+            return bool(peer) and ipaddress.ip_address(peer[0]).is_loopback
+        except ValueError:
+            return False
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: bytes = b"", content_type: str = "text/plain"):
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _run_stream(self, call_id: str, websocket: WebSocket):
+        session = CallSession(call_id, websocket, VoiceActivityDetector(
+            sample_rate=SAMPLE_RATE,
+            threshold_db=self.config.vad_threshold_db,
+            min_speech_ms=self.config.vad_min_speech_ms,
+            hangover_ms=self.config.vad_hangover_ms,
+        ))
+        self.sessions[call_id] = session
+        self._on_answer(call_id)
+        logging.info("Media stream opened for call_id=%s", call_id, extra={"call_id": call_id})
+        try:
+            while True:
+                message = await websocket.recv()
+                if message is None:
+                    break
+                if isinstance(message, bytes):
+                    continue
+                event = json.loads(message)
+                kind = event.get("event")
+                if kind == "start":
+                    session.stream_sid = event.get("streamSid") or event.get("start", {}).get("streamSid", "")
+                    session.spawn(self._converse(session))
+                elif kind == "media":
+                    media = event.get("media", {})
+                    if media.get("track", "inbound") == "inbound":
+                        self._on_audio(session, base64.b64decode(media.get("payload", "")))
+                elif kind == "mark":
+                    session.on_mark(event.get("mark", {}).get("name", ""))
+                elif kind == "stop":
+                    break
+        finally:
+            await session.close()
+            if hasattr(self.ai_manager, "cancel"):
+                self.ai_manager.cancel(call_id)
+            await websocket.close()
+            self.sessions.pop(call_id, None)
+            done = self.call_events.get(call_id)
+            if done:
+                done.set()
+            logging.info("Media stream closed for call_id=%s", call_id, extra={"call_id": call_id})
+
+    def _on_answer(self, call_id: str):
+        answered = self.answered.get(call_id)
+        if answered:
+            answered.set()
+
+    def _on_audio(self, session: CallSession, chunk: bytes):
+        session.inbound.extend(chunk)
+        events = session.vad.process(ulaw_decode(chunk))
+        if session.vad.in_speech and session.vad.speech_ms >= self.config.barge_in_ms:
+            if session.playing:
+                session.interrupt()
+            else:
+                session.cancel_turn()
+        if SPEECH_END in events:
+            session.utterances.put_nowait((bytes(session.inbound), asyncio.get_event_loop().time()))
+            session.inbound.clear()
+        elif not session.vad.in_speech:
+            preroll = PREROLL_MS * SAMPLE_RATE // 1000
+            if len(session.inbound) > preroll:
+                del session.inbound[:-preroll]
+
+    async def _converse(self, session: CallSession):
+        await self._greet(session)
+        while True:
+            ulaw, heard_at = await session.utterances.get()
+            ulaw, session.carried = session.carried + ulaw, b""
+            session.turn = session.spawn(self._take_turn(session, ulaw, heard_at))
+            await asyncio.wait([session.turn])
+            conversation = self.ai_manager.active_conversations.get(session.call_id)
+            if not conversation or not conversation.is_active:
+                await session.hangup()
+                return
+
+    async def _greet(self, session: CallSession):
+        conversation = self.ai_manager.active_conversations.get(session.call_id)
+        if not conversation or not conversation.conversation_history:
+            return
+        if conversation.opening_audio:
+            pcm, sample_rate = conversation.opening_audio
+            await session.play(pcm_to_ulaw(pcm, sample_rate, SAMPLE_RATE))
+            return
+        await self._speak(session, conversation.conversation_history[0]["content"])
+
+    async def _take_turn(self, session: CallSession, ulaw: bytes, heard_at: float):
+        try:
+            text = await self.ai_manager.speech_to_text(ulaw_decode(ulaw).tobytes(), sample_rate=SAMPLE_RATE, call_id=session.call_id)
+        except (asyncio.CancelledError, Cancelled):
+            # The caller went on talking mid-transcription: hear both parts as one utterance.
+            session.carried = ulaw
+            raise
+        if not text:
+            return
+        reply = await self.ai_manager.process_user_input(session.call_id, text)
+        if reply:
+            await self._speak(session, reply, heard_at)
+
+    async def _speak(self, session: CallSession, text: str, heard_at: Optional[float] = None):
+        pcm, sample_rate = await self.ai_manager.synthesize(text, session.call_id)
+        if heard_at is not None:
+            # Turn latency: the caller stopped talking at heard_at and hears the reply from now.
+            latency = asyncio.get_event_loop().time() - heard_at
+            for listener in self.latency_listeners:
+                listener(latency)
+        await session.play(pcm_to_ulaw(pcm, sample_rate, SAMPLE_RATE))
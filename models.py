@@ -1,5 +1,5 @@
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Optional
+from dataclasses import dataclass, asdict, fields
+from typing import Any, List, Dict, Optional
 from enum import Enum
 
 class CallStatus(Enum):
@@ -21,6 +21,8 @@ class Contact:
     opt_out_date: str = ""
     prompt_name: str = "default"
 
+CONTACT_FIELDS = [f.name for f in fields(Contact)]
+
 @dataclass
 class ConversationState:
     contact: Contact
@@ -29,6 +31,9 @@ class ConversationState:
     current_step: str = "introduction"
     is_active: bool = True
     opt_out_requested: bool = False
+    prompt_template: Optional[Any] = None  # pinned at call start so prompt reloads don't affect in-flight calls
+    prompt_name: str = ""
+    opening_audio: Optional[Any] = None  # (pcm, sample_rate) when the opener was pre-generated
 
     def __post_init__(self):
         if self.conversation_history is None:
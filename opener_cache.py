@@ -0,0 +1,62 @@
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+from models import Contact
+
+OpenerKey = Tuple[str, str, str, str, str]
+
+
+@dataclass(frozen=True)
+class Opener:
+    text: str
+    audio: Any  # int16 PCM
+    sample_rate: int
+    version: Optional[int]  # PromptStore version of the template it was rendered from
+
+
+class OpenerCache:
+    """
+    Opening lines and their audio, rendered ahead of the dial. An opener only depends on
+    the prompt and the contact fields the template can reference, so that is the key; the
+    prompt version is checked on the way out, and `invalidate` is registered as a
+    PromptStore listener to drop entries as soon as their prompt changes.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self._entries: "OrderedDict[OpenerKey, Opener]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt_name: str, contact: Contact) -> OpenerKey:
+        return prompt_name, contact.name, contact.company, contact.email, contact.phone_number
+
+    def __contains__(self, key: OpenerKey) -> bool:
+        return key in self._entries
+
+    def put(self, key: OpenerKey, opener: Opener):
+        self._entries[key] = opener
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: OpenerKey, version: Optional[int]) -> Optional[Opener]:
+        opener = self._entries.pop(key, None)
+        if opener and opener.version == version:
+            self.hits += 1
+            return opener
+        self.misses += 1
+        return None
+
+    def invalidate(self, prompt_names: Iterable[str]):
+        prompt_names = set(prompt_names)
+        stale = [key for key in self._entries if key[0] in prompt_names]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            logging.info(f"Dropped {len(stale)} pre-generated openers for changed prompts: {', '.join(sorted(prompt_names))}")
+
+    def metrics(self) -> Dict[str, int]:
+        return {"cached": len(self._entries), "hits": self.hits, "misses": self.misses}
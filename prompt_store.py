@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import string
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Set, Tuple
+
+PROMPT_VARIABLES = frozenset({
+    "name", "company", "email", "phone_number", "agent_name", "conversation_history", "user_input"
+})
+
+
+def template_variables(content: str) -> Set[str]:
+    """Variables referenced by an f-string style template. Raises ValueError on malformed braces."""
+    variables = set()
+    for _, field_name, _, _ in string.Formatter().parse(content):
+        if field_name is None:
+            continue
+        variable = field_name.split(".", 1)[0].split("[", 1)[0]
+        if not variable or variable.isdigit():
+            raise ValueError("positional placeholders are not supported")
+        variables.add(variable)
+    return variables
+
+
+def validate_template(content: str, allowed: FrozenSet[str] = PROMPT_VARIABLES) -> Set[str]:
+    if not content:
+        raise ValueError("template is empty")
+    variables = template_variables(content)
+    unknown = variables - allowed
+    if unknown:
+        raise ValueError(f"unknown variables: {', '.join(sorted(unknown))}")
+    return variables
+
+
+@dataclass(frozen=True)
+class PromptVersion:
+    name: str
+    template: Any
+    variables: FrozenSet[str]
+    version: int
+    signature: Tuple[int, int]
+
+
+class PromptStore:
+    """
+    Compiled prompt templates keyed by file stem. `refresh()` only re-reads files whose
+    mtime/size changed and swaps the whole mapping in one assignment, so readers always
+    see a consistent set; a template that fails validation keeps its previous version.
+    """
+
+    def __init__(self, prompts_dir: str, compile_template: Callable[[str], Any] = str,
+                 allowed_variables: FrozenSet[str] = PROMPT_VARIABLES):
+        self.prompts_dir = Path(prompts_dir)
+        self.compile_template = compile_template
+        self.allowed_variables = allowed_variables
+        self.versions: Dict[str, PromptVersion] = {}
+        self.templates: Dict[str, Any] = {}
+        self._rejected: Dict[str, Tuple[int, int]] = {}
+        self._listeners: List[Callable[[Set[str]], None]] = []
+        self._version = 0
+
+    def add_listener(self, listener: Callable[[Set[str]], None]):
+        """`listener` is called with the names of prompts that changed, were added or were removed."""
+        self._listeners.append(listener)
+
+    def refresh(self) -> Set[str]:
+        self.prompts_dir.mkdir(exist_ok=True)
+        versions = dict(self.versions)
+        changed = set()
+        seen = set()
+        for prompt_file in self.prompts_dir.glob("*.txt"):
+            prompt_name = prompt_file.stem
+            seen.add(prompt_name)
+            try:
+                stat = prompt_file.stat()
+            except OSError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            current = versions.get(prompt_name)
+            if (current and current.signature == signature) or self._rejected.get(prompt_name) == signature:
+                continue
+            try:
+                content = prompt_file.read_text().strip()
+                variables = validate_template(content, self.allowed_variables)
+                template = self.compile_template(content)
+            except Exception as e:
+                self._rejected[prompt_name] = signature
+                kept = f", keeping version {current.version}" if current else ""
+                logging.error(f"Rejected prompt {prompt_name}: {e}{kept}")
+                continue
+            self._rejected.pop(prompt_name, None)
+            self._version += 1
+            versions[prompt_name] = PromptVersion(prompt_name, template, frozenset(variables), self._version, signature)
+            changed.add(prompt_name)
+            logging.info(f"Loaded prompt: {prompt_name} (version {self._version})")
+        for prompt_name in set(versions) - seen:
+            del versions[prompt_name]
+            self._rejected.pop(prompt_name, None)
+            changed.add(prompt_name)
+            logging.info(f"Removed prompt: {prompt_name}")
+        if changed:
+            self.versions = versions
+            self.templates = {name: version.template for name, version in versions.items()}
+            for listener in self._listeners:
+                try:
+                    listener(changed)
+                except Exception as e:
+                    logging.error(f"Prompt change listener failed: {e}")
+        return changed
+
+    async def watch(self, interval: float):
+        logging.info(f"Watching {self.prompts_dir.resolve()} for prompt changes every {interval}s")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Prompt refresh failed: {e}")
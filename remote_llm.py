@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+import httpx
+from cancellation import CancelToken, Cancelled
+from replies import find_stop
+
+# Cheap server-side stops for the common cases; find_stop catches the rest client-side.
+STOP_SEQUENCES = ["\nuser:", "\nUSER INPUT:", "\nassistant:"]
+
+
+class BackendUnavailable(Exception):
+    """Every configured endpoint failed for a request."""
+
+
+class RemoteGenerator:
+    """
+    Streams completions from shared inference servers speaking the OpenAI-compatible
+    `POST /v1/completions` API (vLLM, TGI, llama.cpp server, fake_llm_server). One pooled
+    AsyncClient keeps connections warm across calls. Endpoints are tried round-robin; one
+    that fails to connect, errors or stalls past `read_timeout` is skipped for `cooldown`
+    seconds and the request moves on to the next. Reading stops, and the stream is closed
+    so the server stops generating, at a role marker or when the call's token is cancelled.
+    """
+
+    def __init__(self, endpoints: List[str], model: str = "", connect_timeout: float = 2.0,
+                 read_timeout: float = 10.0, max_connections: int = 100, cooldown: float = 30.0):
+        if not endpoints:
+            raise ValueError("no LLM endpoints configured")
+        self.endpoints = [endpoint.rstrip("/") for endpoint in endpoints]
+        self.model = model
+        self.cooldown = cooldown
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._down_until: Dict[str, float] = {}
+        self._next = 0
+        self.requests = 0
+        self.failovers = 0
+        self.failures = 0
+        self.first_tokens = 0
+        self.first_token_seconds = 0.0
+
+    def _order(self) -> List[str]:
+        """Endpoints to try: healthy ones round-robin, then those cooling down as a last resort."""
+        start = self._next
+        self._next = (self._next + 1) % len(self.endpoints)
+        rotated = self.endpoints[start:] + self.endpoints[:start]
+        now = time.monotonic()
+        return sorted(rotated, key=lambda endpoint: self._down_until.get(endpoint, 0.0) > now)
+
+    async def generate(self, prompt: str, max_new_tokens: int, token: Optional[CancelToken] = None,
+                       temperature: float = 0.7) -> str:
+        """The raw continuation of `prompt`; raises Cancelled or BackendUnavailable."""
+        token = token or CancelToken()
+        request = asyncio.ensure_future(self._generate(prompt, max_new_tokens, token, temperature))
+        # A hang-up cancels the token from elsewhere; abort the HTTP request right away
+        # rather than at the next streamed line.
+        loop = asyncio.get_running_loop()
+        cancelled = asyncio.Event()
+        token.add_callback(lambda: loop.call_soon_threadsafe(cancelled.set))
+        waiter = asyncio.ensure_future(cancelled.wait())
+        try:
+            await asyncio.wait({request, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if not request.done():
+                request.cancel()
+        if not request.done() or request.cancelled():
+            raise Cancelled()
+        return request.result()
+
+    async def _generate(self, prompt: str, max_new_tokens: int, token: CancelToken, temperature: float) -> str:
+        self.requests += 1
+        body = {"model": self.model, "prompt": prompt, "max_tokens": max_new_tokens,
+                "temperature": temperature, "stream": True, "stop": STOP_SEQUENCES}
+        errors = []
+        for attempt, endpoint in enumerate(self._order()):
+            if attempt:
+                self.failovers += 1
+            try:
+                return await self._stream(endpoint, body, token)
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                self._down_until[endpoint] = time.monotonic() + self.cooldown
+                reason = f"HTTP {e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else \
+                    f"{type(e).__name__}: {e}".rstrip(": ")
+                logging.warning(f"LLM endpoint {endpoint} failed ({reason}), skipping it for {self.cooldown:g}s")
+                errors.append(f"{endpoint}: {reason}")
+        self.failures += 1
+        raise BackendUnavailable("; ".join(errors))
+
+    async def _stream(self, endpoint: str, body: Dict, token: CancelToken) -> str:
+        started = time.monotonic()
+        text = ""
+        async with self.client.stream("POST", f"{endpoint}/v1/completions", json=body) as response:
+            response.raise_for_status()
+            # A finished stream is read to its end so the connection goes back to the pool;
+            # leaving early closes it, which is how the server learns to stop generating.
+            async for line in response.aiter_lines():
+                token.raise_if_cancelled()
+                if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+                    continue
+                choice = json.loads(line[5:])["choices"][0]
+                if not text and choice.get("text"):
+                    self.first_tokens += 1
+                    self.first_token_seconds += time.monotonic() - started
+                text += choice.get("text") or ""
+                if not choice.get("finish_reason") and find_stop(text) is not None:
+                    break
+        return text
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def metrics(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "requests": self.requests,
+            "failovers": self.failovers,
+            "failures": self.failures,
+            "avg_first_token_ms": round(1000 * self.first_token_seconds / self.first_tokens, 1) if self.first_tokens else None,
+            "endpoints_down": [endpoint for endpoint in self.endpoints if self._down_until.get(endpoint, 0.0) > now],
+        }
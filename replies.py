@@ -0,0 +1,73 @@
+import re
+import threading
+from typing import Dict, Optional
+
+# A line where the model starts writing the other side of the dialogue (or our prompt's
+# own section headers): everything from there on is not part of the reply.
+ROLE_MARKER = re.compile(
+    r"(?:^|\n)[ \t]*(?:user|assistant|prospect|caller|customer|agent|ai agent|system)(?: input)?[ \t]*:"
+    r"|(?:^|\n)[ \t]*(?:CONVERSATION HISTORY|PROSPECT INFO(?:RMATION)?|RELEVANT INFORMATION)[ \t]*:",
+    re.IGNORECASE,
+)
+# The reply itself may open with our own role label; that is stripped, not a stop.
+LEADING_ROLE = re.compile(r"^\s*(?:assistant|agent|ai agent)[ \t]*:[ \t]*", re.IGNORECASE)
+
+MIN_NEW_TOKENS = 16
+MAX_NEW_TOKENS = 200
+DEFAULT_TOKENS_PER_SECOND = 3.3  # ~150 spoken words a minute at ~1.3 tokens per word
+SMOOTHING = 0.2
+
+
+def find_stop(text: str) -> Optional[int]:
+    """Offset in `text` (a raw continuation) where the reply ends, or None if it hasn't yet."""
+    start = LEADING_ROLE.match(text)
+    offset = start.end() if start else 0
+    match = ROLE_MARKER.search(text, offset)
+    return match.start() if match else None
+
+
+def trim_reply(text: str) -> str:
+    """The spoken part of a continuation: no leading role label, nothing past a role marker."""
+    stop = find_stop(text)
+    if stop is not None:
+        text = text[:stop]
+    return LEADING_ROLE.sub("", text, count=1).strip()
+
+
+def parse_budgets(spec: str) -> Dict[str, float]:
+    """"saas_product=15,default=20" -> {"saas_product": 15.0, "default": 20.0}"""
+    budgets = {}
+    for item in spec.split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            budgets[name.strip()] = float(seconds)
+    return budgets
+
+
+class SpokenBudget:
+    """
+    Caps max_new_tokens from how long a reply may take to say. Tokens per spoken second
+    start from a typical speaking rate and are then learned per prompt from the audio the
+    TTS actually produced, so the cap tracks each script's wording and voice.
+    """
+
+    def __init__(self, default_seconds: float, budgets: Optional[Dict[str, float]] = None):
+        self.default_seconds = default_seconds
+        self.budgets = budgets or {}
+        self.tokens_per_second: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def seconds(self, prompt_name: str) -> float:
+        return self.budgets.get(prompt_name, self.default_seconds)
+
+    def max_new_tokens(self, prompt_name: str) -> int:
+        rate = self.tokens_per_second.get(prompt_name, DEFAULT_TOKENS_PER_SECOND)
+        return int(min(MAX_NEW_TOKENS, max(MIN_NEW_TOKENS, round(self.seconds(prompt_name) * rate))))
+
+    def observe(self, prompt_name: str, tokens: int, spoken_seconds: float):
+        if tokens <= 0 or spoken_seconds <= 0:
+            return
+        rate = tokens / spoken_seconds
+        with self._lock:
+            current = self.tokens_per_second.get(prompt_name)
+            self.tokens_per_second[prompt_name] = rate if current is None else current + SMOOTHING * (rate - current)
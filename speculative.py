@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+PLAIN = "plain"
+ASSISTED = "assisted"
+
+
+@dataclass
+class GenerationStats:
+    calls: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+    target_passes: int = 0
+    draft_passes: int = 0
+
+    @property
+    def ms_per_token(self) -> float:
+        return 1000 * self.seconds / self.tokens if self.tokens else 0.0
+
+    @property
+    def tokens_per_pass(self) -> float:
+        """New tokens per forward pass of the main model: 1.0 without a draft model."""
+        return self.tokens / self.target_passes if self.target_passes else 0.0
+
+    @property
+    def acceptance_rate(self) -> float:
+        # Every main-model pass yields the accepted draft tokens plus one token of its own.
+        accepted = self.tokens - self.target_passes
+        return max(0, accepted) / self.draft_passes if self.draft_passes else 0.0
+
+
+class SpeculativeDecoder:
+    """
+    Assisted generation: a small draft model proposes a few tokens, the main model checks
+    them in one forward pass and keeps the longest prefix it agrees with. With sampling,
+    transformers uses speculative sampling, so replies are distributed exactly as if the
+    main model sampled alone; greedy replies are token-for-token identical.
+
+    Only prompts listed in `assisted_prompts` ("*" for all) use the draft model; the rest
+    generate normally and provide the per-token baseline that speedup is measured against.
+    """
+
+    def __init__(self, model, tokenizer, draft_model: str, assisted_prompts: str = "", draft_tokens: int = 0):
+        self.tokenizer = tokenizer
+        self.assisted_prompts = {name.strip() for name in assisted_prompts.split(",") if name.strip()}
+        # Assisted generation needs both models on one device; the pipeline has already
+        # placed the main model.
+        self.draft = AutoModelForCausalLM.from_pretrained(draft_model).to(model.device)
+        if AutoTokenizer.from_pretrained(draft_model).get_vocab() != tokenizer.get_vocab():
+            raise ValueError(f"Draft model {draft_model} does not share the main model's tokenizer")
+        if draft_tokens:
+            self.draft.generation_config.num_assistant_tokens = draft_tokens
+        self.stats: Dict[str, Dict[str, GenerationStats]] = {}
+        self._lock = threading.Lock()
+        self._passes = threading.local()
+        model.register_forward_hook(self._count_pass("target"))
+        self.draft.register_forward_hook(self._count_pass("draft"))
+        logging.info(f"Speculative decoding with {draft_model} for prompts: {', '.join(sorted(self.assisted_prompts)) or 'none'}")
+
+    def _count_pass(self, model_name: str) -> Callable:
+        def hook(module, args, output):
+            passes = getattr(self._passes, "value", None)
+            if passes is not None:
+                passes[model_name] += 1
+        return hook
+
+    def enabled_for(self, prompt_name: str) -> bool:
+        return "*" in self.assisted_prompts or prompt_name in self.assisted_prompts
+
+    def generate(self, generator, prompt: str, prompt_name: str, **generate_kwargs: Any) -> list:
+        """Run `generator` (a text-generation pipeline) on `prompt`, with the draft model if enabled for `prompt_name`."""
+        mode = ASSISTED if self.enabled_for(prompt_name) else PLAIN
+        if mode == ASSISTED:
+            generate_kwargs["assistant_model"] = self.draft
+        self._passes.value = {"target": 0, "draft": 0}
+        started = time.perf_counter()
+        try:
+            result = generator(prompt, **generate_kwargs)
+        finally:
+            passes, self._passes.value = self._passes.value, None
+        elapsed = time.perf_counter() - started
+        text = result[0]["generated_text"]
+        if text.startswith(prompt):
+            text = text[len(prompt):]
+        tokens = len(self.tokenizer(text, add_special_tokens=False).input_ids)
+        with self._lock:
+            stats = self.stats.setdefault(prompt_name, {}).setdefault(mode, GenerationStats())
+            stats.calls += 1
+            stats.tokens += tokens
+            stats.seconds += elapsed
+            stats.target_passes += passes["target"]
+            stats.draft_passes += passes["draft"]
+        return result
+
+    def _baseline_ms_per_token(self, prompt_name: str) -> float:
+        own = self.stats.get(prompt_name, {}).get(PLAIN)
+        if own and own.tokens:
+            return own.ms_per_token
+        plain = [modes[PLAIN] for modes in self.stats.values() if PLAIN in modes]
+        tokens = sum(stats.tokens for stats in plain)
+        return 1000 * sum(stats.seconds for stats in plain) / tokens if tokens else 0.0
+
+    def metrics(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Per prompt: acceptance rate, tokens per main-model pass, ms/token and measured speedup."""
+        report = {}
+        with self._lock:
+            for prompt_name, modes in self.stats.items():
+                for mode, stats in modes.items():
+                    entry = {
+                        "calls": stats.calls,
+                        "tokens": stats.tokens,
+                        "ms_per_token": round(stats.ms_per_token, 2),
+                        "tokens_per_pass": round(stats.tokens_per_pass, 3),
+                    }
+                    if mode == ASSISTED:
+                        baseline = self._baseline_ms_per_token(prompt_name)
+                        entry["acceptance_rate"] = round(stats.acceptance_rate, 3)
+                        entry["speedup"] = round(baseline / stats.ms_per_token, 2) if baseline and stats.ms_per_token else None
+                    report.setdefault(prompt_name, {})[mode] = entry
+        return report
@@ -0,0 +1,115 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import zlib
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+from config import Config
+
+# LogRecord attributes that are not user-supplied `extra` fields.
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `call_id`, `event` and any other `extra` fields become keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "call_id": getattr(record, "call_id", None),
+            "msg": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RESERVED and key not in entry)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Enqueues the record as is. The stock QueueHandler renders the message on the calling
+    thread; here `msg % args` and JSON encoding happen on the listener thread instead, so a
+    log call on the event loop costs one record allocation and a queue put.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _Listener(QueueListener):
+    def stop(self):
+        if self._thread:  # both at exit and by the caller
+            super().stop()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the records of each sampled `event` class ("turn", "stt", ...).
+    Records with a call_id are kept or dropped per call, so a sampled conversation is
+    logged in full; others are kept every 1/rate-th time. WARNING and above always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._seen: Dict[str, int] = defaultdict(int)
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "event", ""), 1.0)
+        if rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        call_id = getattr(record, "call_id", None)
+        if call_id:
+            keep = zlib.crc32(call_id.encode()) % 10000 < rate * 10000
+        else:
+            seen = self._seen[record.event]
+            self._seen[record.event] += 1
+            keep = rate > 0 and seen % max(1, round(1 / rate)) == 0
+        if not keep:
+            self.dropped += 1
+        return keep
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """"turn=0.1,screening=0.01" -> {"turn": 0.1, "screening": 0.01}"""
+    rates = {}
+    for item in spec.split(","):
+        event, _, rate = (part.strip() for part in item.partition("="))
+        if event and rate:
+            rates[event] = float(rate)
+            if not 0.0 <= rates[event] <= 1.0:
+                raise ValueError(f"LOG_SAMPLING rate for {event} must be between 0 and 1")
+    return rates
+
+
+def setup_logging(config: Optional[Config] = None) -> QueueListener:
+    """
+    Routes the root logger through an in-memory queue to a listener thread that writes
+    human-readable lines to stdout and JSON lines to a size-rotated LOG_FILE. The listener
+    is stopped at exit, after draining the queue; stopping it earlier flushes it.
+    """
+    config = config or Config()
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    log_file = RotatingFileHandler(config.log_file, maxBytes=config.log_max_bytes, backupCount=config.log_backups)
+    log_file.setFormatter(JsonFormatter())
+    listener = _Listener(records, console, log_file, respect_handler_level=True)
+
+    handler = LazyQueueHandler(records)
+    handler.addFilter(SamplingFilter(parse_sampling(config.log_sampling)))
+    root = logging.getLogger()
+    for previous in list(root.handlers):
+        root.removeHandler(previous)
+        previous.close()
+    root.addHandler(handler)
+    root.setLevel(config.log_level.upper())
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -16,8 +16,9 @@ def initiate_call(contact: Contact, call_id: str, config: Config, twiml_url: str
             url=twiml_url,
             timeout=config.conversation_timeout
         )
-        logging.info(f"Call initiated: {contact.phone_number} -> {call.sid} (Prompt: {contact.prompt_name})")
+        logging.info("Call initiated: %s -> %s (Prompt: %s)", contact.phone_number, call.sid, contact.prompt_name,
+                     extra={"call_id": call_id, "call_sid": call.sid})
         return call.sid
     except Exception as e:
-        logging.error(f"Twilio call failed for {contact.phone_number}: {e}")
+        logging.error("Twilio call failed for %s: %s", contact.phone_number, e, extra={"call_id": call_id})
         raise 
\ No newline at end of file
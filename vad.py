@@ -0,0 +1,111 @@
+import logging
+from typing import List, Union
+import numpy as np
+
+SPEECH_START = "speech_start"
+SPEECH_END = "speech_end"
+
+
+class VoiceActivityDetector:
+    """
+    Energy / zero-crossing voice activity detector for 16-bit PCM.
+    Frame features are computed for a whole chunk at once; only the onset/hangover
+    state machine steps per frame. Voiced frames are loud; unvoiced consonants are
+    quieter but cross zero often, so they count as speech within `unvoiced_margin_db`.
+    The noise floor is a low percentile of the energy of the last `noise_window_ms` of
+    frames, speech or not: pauses between words keep it down while someone talks, and
+    steady noise raises it, and with it the thresholds, within one window.
+    """
+
+    def __init__(self, sample_rate: int = 8000, frame_ms: int = 20, threshold_db: float = -45.0,
+                 noise_margin_db: float = 12.0, unvoiced_margin_db: float = 8.0, zcr_threshold: float = 0.25,
+                 min_speech_ms: int = 100, hangover_ms: int = 300, max_speech_ms: int = 15000,
+                 noise_window_ms: int = 3000, noise_percentile: float = 10.0):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.unvoiced_margin_db = unvoiced_margin_db
+        self.zcr_threshold = zcr_threshold
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.max_speech_frames = max(1, max_speech_ms // frame_ms)
+        self.noise_floor_db = threshold_db - noise_margin_db
+        # Starts full of the nominal floor, so the first seconds of a call (often speech)
+        # cannot move it on their own.
+        self._energies = np.full(max(1, noise_window_ms // frame_ms), self.noise_floor_db, dtype=np.float32)
+        self._energy_pos = 0
+        self._noise_rank = int(noise_percentile / 100 * (self._energies.size - 1))
+        self.in_speech = False
+        self.speech_frames = 0
+        self.silence_frames = 0
+        self._voiced_run = 0
+        self._residual = np.zeros(0, dtype=np.int16)
+
+    @property
+    def speech_ms(self) -> int:
+        return self.speech_frames * self.frame_ms if self.in_speech else self._voiced_run * self.frame_ms
+
+    def reset(self):
+        self.in_speech = False
+        self.speech_frames = 0
+        self.silence_frames = 0
+        self._voiced_run = 0
+        self._residual = np.zeros(0, dtype=np.int16)
+
+    def frame_features(self, frames: np.ndarray):
+        samples = frames.astype(np.float32) / 32768.0
+        energy_db = 10.0 * np.log10(np.mean(samples * samples, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+        return energy_db, zcr
+
+    def classify(self, frames: np.ndarray) -> np.ndarray:
+        energy_db, zcr = self.frame_features(frames)
+        self._track_noise(energy_db)
+        threshold = max(self.threshold_db, self.noise_floor_db + self.noise_margin_db)
+        voiced = energy_db > threshold
+        unvoiced = (energy_db > threshold - self.unvoiced_margin_db) & (zcr > self.zcr_threshold)
+        return voiced | unvoiced
+
+    def _track_noise(self, energy_db: np.ndarray):
+        size = self._energies.size
+        energy_db = energy_db[-size:]
+        end = self._energy_pos + energy_db.size
+        if end <= size:
+            self._energies[self._energy_pos:end] = energy_db
+        else:
+            split = size - self._energy_pos
+            self._energies[self._energy_pos:] = energy_db[:split]
+            self._energies[:end - size] = energy_db[split:]
+        self._energy_pos = end % size
+        self.noise_floor_db = float(np.partition(self._energies, self._noise_rank)[self._noise_rank])
+
+    def process(self, pcm: Union[bytes, bytearray, memoryview, np.ndarray]) -> List[str]:
+        samples = pcm if isinstance(pcm, np.ndarray) else np.frombuffer(pcm, dtype=np.int16)
+        if self._residual.size:
+            samples = np.concatenate((self._residual, samples))
+        usable = samples.size - samples.size % self.frame_samples
+        self._residual = samples[usable:].copy()
+        if not usable:
+            return []
+        events = []
+        for is_speech in self.classify(samples[:usable].reshape(-1, self.frame_samples)):
+            if not self.in_speech:
+                self._voiced_run = self._voiced_run + 1 if is_speech else 0
+                if self._voiced_run >= self.min_speech_frames:
+                    self.in_speech = True
+                    self.speech_frames = self._voiced_run
+                    self.silence_frames = 0
+                    events.append(SPEECH_START)
+                continue
+            self.speech_frames += 1
+            self.silence_frames = 0 if is_speech else self.silence_frames + 1
+            if self.silence_frames >= self.hangover_frames or self.speech_frames >= self.max_speech_frames:
+                logging.debug(f"End of utterance after {self.speech_frames * self.frame_ms} ms")
+                self.in_speech = False
+                self.speech_frames = 0
+                self._voiced_run = 0
+                events.append(SPEECH_END)
+        return events